@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# A fake Junos CLI for local testing and benchmarks. Point netexec's -c at
+# it instead of ssh; it takes [user@]device as its last argument and talks
+# over the pty that pexpect gives it, e.g.:
+#
+#   netexec -c 'benchmarks/fakejunos.py --latency 0.02' -i cmds.txt r1
+#
+# The terminal is put in raw mode, and each line is echoed only when the
+# fake gets to it, --latency seconds after it arrived; lines sent together
+# arrive together, as they would over one ssh connection.
+#
+# Failures can be injected for a share of devices (picked by a stable hash
+# of the device name, so reruns fail the same devices). A pending commit
+# confirmed is kept in a small file per device under --state-dir, so a
+# later connection can see it, confirm it, or find it rolled back.
+
+from argparse import ArgumentParser
+from hashlib import md5
+from select import select
+from tempfile import gettempdir
+from time import sleep, time
+import os
+import random
+import re
+import sys
+import termios
+import tty
+
+failtypes = ['refused', 'auth', 'hang', 'eof', 'syntax']
+
+
+class FakeJunos:
+
+    def __init__(self, args):
+        """Initialize a fake device from command line options"""
+        self.args = args
+        target = args.target
+        if '@' in target:
+            self.user, self.host = target.split('@', 1)
+        else:
+            self.user, self.host = 'netexec', target
+        self.mode = 'exec'
+        self.inbuffer = b''
+        self.arrived = time() # when the latest input was read
+        self.skipnewline = False # drop a \n right after a \r
+        self.candidate = []
+        self.linecount = 0
+        digest = md5(self.host.encode('utf-8')).hexdigest()
+        if args.flaky:
+            # A new draw on every connection, so retries can succeed
+            chance = random.random()
+        else:
+            chance = int(digest[:8], 16) / 0xffffffff
+        self.failing = args.fail and chance < args.fail_rate
+
+
+    def write(self, text):
+        """Write text to the terminal"""
+        sys.stdout.write(text.replace('\n', '\r\n'))
+        sys.stdout.flush()
+
+
+    def readline(self, echo=True):
+        """Read a line of input, or None at end of input"""
+        # A ctrl-d at the start of a line comes back as a line of its own
+        while True:
+            if self.skipnewline and self.inbuffer:
+                if self.inbuffer.startswith(b'\n'):
+                    self.inbuffer = self.inbuffer[1:]
+                self.skipnewline = False
+            end = re.search(b'[\r\n\x04]', self.inbuffer)
+            if end:
+                break
+            try:
+                data = os.read(sys.stdin.fileno(), 4096)
+            except(OSError):
+                data = b''
+            if not data:
+                return None
+            self.inbuffer += data
+            self.arrived = time()
+        if end.group() == b'\x04':
+            position = end.start() or 1
+            line = self.inbuffer[:end.start()] or b'\x04'
+            self.inbuffer = self.inbuffer[position:]
+        else:
+            line = self.inbuffer[:end.start()]
+            self.inbuffer = self.inbuffer[end.end():]
+            self.skipnewline = end.group() == b'\r'
+        line = line.decode('utf-8', 'replace')
+        # Network latency: the line gets here a while after it was sent
+        wait = self.arrived + self.args.latency - time()
+        if wait > 0:
+            sleep(wait)
+        if echo and line != '\x04':
+            self.write(line + '\n')
+        return line
+
+
+    def prompt(self):
+        """Write the prompt for the current mode"""
+        if self.mode == 'config':
+            self.write('\n[edit]\n' + self.user + '@' + self.host + '# ')
+        else:
+            self.write('\n' + self.user + '@' + self.host + '> ')
+
+
+    def echo_typeahead(self, seconds):
+        """Echo input sent in the first moments after a password prompt"""
+        # ssh turns echo off just after it asks for the password, so a
+        # reply sent right away can still be echoed
+        while select([sys.stdin], [], [], seconds)[0]:
+            try:
+                data = os.read(sys.stdin.fileno(), 4096)
+            except(OSError):
+                return
+            if not data:
+                return
+            self.inbuffer += data
+            self.arrived = time()
+            self.write(data.decode('utf-8', 'replace'))
+
+
+    def set_raw(self):
+        """Put the terminal in raw mode; the fake does its own echo"""
+        try:
+            tty.setraw(sys.stdin.fileno())
+        except(termios.error):
+            pass
+
+
+    def login(self):
+        """Act out an ssh login; return False if it fails"""
+        if self.failing and self.args.fail == 'refused':
+            self.write('ssh: connect to host ' + self.host + \
+                    ' port 22: Connection refused\n')
+            return False
+        if self.args.hostkey:
+            self.write('The authenticity of host \'' + self.host + \
+                    '\' can\'t be established.\n' + \
+                    'Are you sure you want to continue connecting ' + \
+                    '(yes/no/[fingerprint])? ')
+            if self.readline() != 'yes':
+                self.write('Host key verification failed.\n')
+                return False
+        if self.args.password is not None:
+            for attempt in range(3):
+                self.write('Password:')
+                self.echo_typeahead(0.005)
+                password = self.readline(echo=False)
+                self.write('\n')
+                if password == self.args.password and \
+                        not (self.failing and self.args.fail == 'auth'):
+                    break
+                self.write('Permission denied, please try again.\n')
+            else:
+                self.write(self.user + '@' + self.host + \
+                        ': Permission denied (publickey,password).\n')
+                return False
+        elif self.failing and self.args.fail == 'auth':
+            self.write(self.user + '@' + self.host + \
+                    ': Permission denied (publickey).\n')
+            return False
+        self.write('--- JUNOS 20.4R3 fake (netexec benchmarks)\n')
+        return True
+
+
+    def statefile(self):
+        """Return the path of the device's pending commit file"""
+        os.makedirs(self.args.state_dir, exist_ok=True)
+        return os.path.join(self.args.state_dir, self.host)
+
+
+    def commit(self, minutes=None):
+        """Commit, starting a rollback timer if minutes is set"""
+        if minutes is None:
+            if os.path.exists(self.statefile()):
+                os.remove(self.statefile())
+            return
+        rollback = time() + float(minutes) * self.args.minute
+        with open(self.statefile(), 'w') as statefile:
+            statefile.write(str(rollback) + '\n')
+
+
+    def rollback_in(self):
+        """Return seconds until a pending commit rolls back, or None"""
+        try:
+            with open(self.statefile()) as statefile:
+                left = float(statefile.read()) - time()
+        except(IOError, ValueError):
+            return None
+        if left <= 0:
+            return None
+        return left
+
+
+    def show(self, line):
+        """Write output for a show command"""
+        if line == 'show system commit':
+            left = self.rollback_in()
+            if left is not None:
+                self.write('0   2024-01-01 00:00:00 UTC by ' + self.user + \
+                        ' via cli commit confirmed, rollback in ' + \
+                        str(int(left / self.args.minute) + 1) + 'mins\n')
+            else:
+                self.write('0   2024-01-01 00:00:00 UTC by ' + self.user + \
+                        ' via cli\n')
+            return
+        if line == 'show | compare':
+            if self.candidate:
+                self.write('[edit]\n')
+                for setline in self.candidate:
+                    self.write('+  ' + setline[4:] + ';\n')
+            return
+        for number in range(self.args.output_lines):
+            self.write('ge-0/0/' + str(number) + \
+                    '    up    up    fake interface for ' + self.host + '\n')
+
+
+    def load_terminal(self):
+        """Read config lines until end of input (ctrl-d)"""
+        self.write('[Type ^D at a new line to end input]\n')
+        count = 0
+        while True:
+            line = self.readline()
+            if line is None or line == '\x04':
+                break
+            if line.strip():
+                self.candidate.append(line.strip())
+                count += 1
+        if self.failing and self.args.fail == 'syntax':
+            self.write('terminal:1:(0) syntax error: ' + \
+                    self.candidate[0].split()[-1] + '\n' + \
+                    'load complete (1 errors)\n')
+        else:
+            self.write('load complete\n')
+
+
+    def command(self, line):
+        """Run one command line; return False to end the session"""
+        self.linecount += 1
+        if self.failing and self.mode == 'config' and \
+                self.linecount >= self.args.fail_after:
+            if self.args.fail == 'hang':
+                while self.readline(echo=False) is not None:
+                    pass
+                return False
+            elif self.args.fail == 'eof':
+                self.write('Connection to ' + self.host + ' closed.\n')
+                return False
+        if not line.strip():
+            pass
+        elif line == 'exit' or line == 'quit':
+            if self.mode == 'config':
+                self.mode = 'exec'
+                self.candidate = []
+                self.write('Exiting configuration mode\n')
+            else:
+                return False
+        elif line.startswith('set cli screen-length'):
+            self.write('Screen length set to ' + line.split()[-1] + '\n')
+        elif line.startswith('set cli screen-width'):
+            self.write('Screen width set to ' + line.split()[-1] + '\n')
+        elif line.startswith('configure'):
+            self.mode = 'config'
+            self.write('warning: uncommitted changes will be discarded ' + \
+                    'on exit\nEntering configuration mode\n')
+        elif self.mode == 'config' and line.startswith('set '):
+            if self.failing and self.args.fail == 'syntax':
+                self.write('                          ^\n' + \
+                        'syntax error.\n')
+            else:
+                self.candidate.append(line)
+        elif self.mode == 'config' and line.startswith('load '):
+            self.load_terminal()
+        elif self.mode == 'config' and line.startswith('commit'):
+            if self.args.commit_latency:
+                sleep(self.args.commit_latency)
+            words = line.split()
+            if len(words) > 1 and words[1] == 'confirmed':
+                minutes = words[2] if len(words) > 2 else '10'
+                self.commit(minutes)
+                self.write('configuration check succeeds\n' + \
+                        'commit confirmed will be automatically rolled ' + \
+                        'back in ' + minutes + ' minutes unless confirmed\n')
+            else:
+                self.commit()
+            self.write('commit complete\n')
+            if 'and-quit' in line:
+                self.mode = 'exec'
+                self.candidate = []
+                self.write('Exiting configuration mode\n')
+        elif line.startswith('show') or line.startswith('run show'):
+            self.show(line)
+        else:
+            self.write('                          ^\n' + \
+                    'unknown command.\n')
+        self.prompt()
+        return True
+
+
+    def run(self):
+        """Run the fake session"""
+        self.set_raw()
+        if not self.login():
+            return 255
+        self.prompt()
+        while True:
+            line = self.readline()
+            if line is None or not self.command(line):
+                return 0
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--latency',
+            action = 'store', type = float, default = 0,
+            help = 'seconds from sending a line to the fake seeing it')
+    parser.add_argument('--commit-latency',
+            action = 'store', dest = 'commit_latency', type = float,
+            default = 0,
+            help = 'extra seconds to wait before answering a commit')
+    parser.add_argument('--output-lines',
+            action = 'store', dest = 'output_lines', type = int,
+            default = 20,
+            help = 'lines of output for show commands')
+    parser.add_argument('--password',
+            action = 'store',
+            help = 'ask for this password at login')
+    parser.add_argument('--hostkey',
+            action = 'store_true',
+            help = 'ask the ssh host key question at login')
+    parser.add_argument('--fail',
+            action = 'store', choices = failtypes,
+            help = 'failure to inject for some devices')
+    parser.add_argument('--fail-rate',
+            action = 'store', dest = 'fail_rate', type = float,
+            default = 1.0,
+            help = 'share of devices that fail (default 1.0)')
+    parser.add_argument('--flaky',
+            action = 'store_true',
+            help = 'pick failing devices again on every connection')
+    parser.add_argument('--fail-after',
+            action = 'store', dest = 'fail_after', type = int, default = 4,
+            help = 'command count at which hang/eof failures start')
+    parser.add_argument('--state-dir',
+            action = 'store', dest = 'state_dir',
+            default = os.path.join(gettempdir(), 'fakejunos'),
+            help = 'directory for pending commit confirmed timers')
+    parser.add_argument('--minute',
+            action = 'store', type = float, default = 60,
+            help = 'seconds in a commit confirmed minute (default 60)')
+    parser.add_argument('-p',
+            action = 'store', dest = 'port', type = int,
+            help = 'port, as ssh would get it (ignored)')
+    parser.add_argument('target', action = 'store',
+            help = '[user@]device, as ssh would get it')
+    args = parser.parse_args()
+
+    sys.exit(FakeJunos(args).run())
+
+
+if __name__ == "__main__":
+    main()
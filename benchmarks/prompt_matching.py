@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Compare prompt matching with raw pattern strings (recompiled on every
+# expect, whole buffer searched) against the cached, compiled pattern
+# lists and search window that DeviceTypeModule uses now.
+
+from argparse import ArgumentParser
+from time import time
+import sys
+import pexpect
+from netexec.devicetypes.junos import DeviceTypeModule
+
+# Child process: print blocks of output lines, each ending in a prompt
+childscript = '''
+import sys
+blocks, lines = int(sys.argv[1]), int(sys.argv[2])
+out = sys.stdout
+for block in range(blocks):
+    for line in range(lines):
+        out.write('ge-0/0/' + str(line) + '   up    up   some interface text\\n')
+    out.write('lab@router-1> ')
+out.flush()
+'''
+
+
+def run_raw(module, blocks, lines):
+    """Match each prompt with expect() on raw strings, no search window"""
+    px = pexpect.spawn(sys.executable, args=['-c', childscript,
+        str(blocks), str(lines)], timeout=600)
+    start = time()
+    for block in range(blocks):
+        px.expect(module.promptoptions)
+    seconds = time() - start
+    px.close()
+    return seconds
+
+
+def run_compiled(module, blocks, lines):
+    """Match each prompt with expect_list() on cached compiled patterns"""
+    px = pexpect.spawn(sys.executable, args=['-c', childscript,
+        str(blocks), str(lines)], timeout=600,
+        searchwindowsize=module.searchwindowsize)
+    start = time()
+    for block in range(blocks):
+        px.expect_list(module.compile_patterns(module.promptoptions))
+    seconds = time() - start
+    px.close()
+    return seconds
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-b',
+            action = 'store', dest = 'blocks', type = int, default = 2000,
+            help = 'number of prompts in the many-prompts case')
+    parser.add_argument('-l',
+            action = 'store', dest = 'lines', type = int, default = 10000,
+            help = 'output lines in the large-output case')
+    args = parser.parse_args()
+    module = DeviceTypeModule()
+
+    cases = [('many prompts, small output', args.blocks, 2),
+            ('one prompt, large output', 1, args.lines)]
+    for name, blocks, lines in cases:
+        raw = run_raw(module, blocks, lines)
+        compiled = run_compiled(module, blocks, lines)
+        print(name + ':')
+        print('  raw expect()    : ' + '{:.3f}'.format(raw) + ' s')
+        print('  compiled, window: ' + '{:.3f}'.format(compiled) + ' s')
+        print('  speedup         : ' + '{:.1f}'.format(raw / compiled) + 'x')
+
+
+if __name__ == "__main__":
+    main()
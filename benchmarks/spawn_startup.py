@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Compare session startup through 'bash -ic' with spawning the connect
+# command directly, as DeviceTypeModule.spawn does now.
+
+from argparse import ArgumentParser
+from time import time
+import shlex
+import pexpect
+
+
+def spawn_shell(command):
+    """Start a command the old way, through an interactive bash"""
+    return pexpect.spawn('bash -ic "' + command + '"')
+
+
+def spawn_direct(command):
+    """Start a command directly from an argument list"""
+    argv = shlex.split(command)
+    return pexpect.spawn(argv[0], args=argv[1:])
+
+
+def time_spawns(spawner, command, count):
+    """Return seconds per spawn, until the command exits"""
+    start = time()
+    for i in range(count):
+        px = spawner(command)
+        px.expect(pexpect.EOF, timeout=30)
+        px.close()
+    return (time() - start) / count
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-c',
+            action = 'store', dest = 'command', default = 'true',
+            help = 'command to start (default true)')
+    parser.add_argument('-n',
+            action = 'store', dest = 'count', type = int, default = 50,
+            help = 'number of spawns per launch path (default 50)')
+    args = parser.parse_args()
+
+    shell = time_spawns(spawn_shell, args.command, args.count)
+    direct = time_spawns(spawn_direct, args.command, args.count)
+    print('bash -ic : ' + '{:.1f}'.format(shell * 1000) + ' ms per spawn')
+    print('direct   : ' + '{:.1f}'.format(direct * 1000) + ' ms per spawn')
+    print('speedup  : ' + '{:.1f}'.format(shell / direct) + 'x')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Time netexec startup for runs that never connect (--version and
+# --list-types) against a bare interpreter, and check which heavy modules
+# each one imports.
+
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+from time import time
+import subprocess
+import sys
+
+repo = dirname(dirname(abspath(__file__)))
+
+# Modules that should only load once a session is made
+heavymodules = ['pexpect', 'netexec.devicetypes.type', 'asyncio',
+        'concurrent.futures']
+
+# Report loaded modules at exit, after netexec.core.main() exits
+probe = """
+import atexit, sys
+atexit.register(lambda: sys.__stderr__.write('MODULES ' +
+        ' '.join(m for m in {} if m in sys.modules) + '\\n'))
+sys.argv = ['netexec'] + {}
+from netexec.core import main
+main()
+"""
+
+
+def time_runs(argv, count):
+    """Return seconds per run of a python command line"""
+    start = time()
+    for i in range(count):
+        subprocess.run([sys.executable] + argv, cwd=repo,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time() - start) / count
+
+
+def loaded_modules(options):
+    """Return the heavy modules a netexec run imports"""
+    result = subprocess.run([sys.executable, '-c',
+        probe.format(repr(heavymodules), repr(options))], cwd=repo,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    for line in result.stderr.splitlines():
+        if line.startswith('MODULES'):
+            return line.split()[1:]
+    return ['?']
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-n',
+            action = 'store', dest = 'count', type = int, default = 20,
+            help = 'number of runs per command (default 20)')
+    args = parser.parse_args()
+
+    baseline = time_runs(['-c', 'pass'], args.count)
+    print('python -c pass : ' + \
+            '{:.1f}'.format(baseline * 1000) + ' ms per run')
+    for options in [['--version'], ['--list-types']]:
+        seconds = time_runs(['-m', 'netexec.core'] + options, args.count)
+        heavy = loaded_modules(options)
+        print(options[0].ljust(14) + ' : ' + \
+                '{:.1f}'.format(seconds * 1000) + ' ms per run (' + \
+                '{:.1f}'.format((seconds - baseline) * 1000) + \
+                ' ms over python), imports: ' + (', '.join(heavy) or 'none'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Measure netexec throughput against fake Junos devices (fakejunos.py):
+# devices per minute, config lines per second and peak RSS of the netexec
+# process, for a range of fleet sizes. Run from the repository root, e.g.:
+#
+#   benchmarks/throughput.py -n 1,10,100 -w 50 -- --window 8
+
+from argparse import ArgumentParser, REMAINDER
+from os import environ, wait4
+from os.path import abspath, dirname, join
+from tempfile import TemporaryDirectory
+from time import time
+import json
+import subprocess
+import sys
+
+benchdir = dirname(abspath(__file__))
+repodir = dirname(benchdir)
+
+
+def write_files(workdir, devices, lines):
+    """Write a device list and an input file; return their paths"""
+    devicelist = join(workdir, 'devices.txt')
+    with open(devicelist, 'w') as f:
+        for number in range(devices):
+            f.write('fake-' + str(number).zfill(5) + '\n')
+    inputfile = join(workdir, 'input.txt')
+    with open(inputfile, 'w') as f:
+        for number in range(lines):
+            f.write('set interfaces ge-0/0/' + str(number) + \
+                    ' description "netexec benchmark"\n')
+    return devicelist, inputfile
+
+
+def run_netexec(args, devices, workdir):
+    """Run netexec once; return (seconds, peak RSS in MB, records)"""
+    devicelist, inputfile = write_files(workdir, devices, args.lines)
+    results = join(workdir, 'results.jsonl')
+    fake = sys.executable + ' ' + join(benchdir, 'fakejunos.py') + \
+            ' ' + args.fake
+    command = [sys.executable, '-m', 'netexec.core', '-c', fake,
+            '-i', inputfile, '-l', devicelist, '--commit',
+            '-w', str(args.workers), '-o', 'null',
+            '--results', results] + args.netexec
+    env = environ.copy()
+    env['PYTHONPATH'] = repodir
+    start = time()
+    process = subprocess.Popen(command, env=env)
+    pid, status, usage = wait4(process.pid, 0)
+    seconds = time() - start
+    records = []
+    with open(results) as f:
+        for line in f:
+            records.append(json.loads(line))
+    # ru_maxrss is in kilobytes on Linux
+    return seconds, usage.ru_maxrss / 1024.0, records
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-n',
+            action = 'store', dest = 'devices', default = '1,10,100,1000',
+            help = 'comma separated fleet sizes (default 1,10,100,1000)')
+    parser.add_argument('-l',
+            action = 'store', dest = 'lines', type = int, default = 20,
+            help = 'config lines per device (default 20)')
+    parser.add_argument('-w',
+            action = 'store', dest = 'workers', type = int, default = 50,
+            help = 'netexec workers (default 50)')
+    parser.add_argument('-f',
+            action = 'store', dest = 'fake', default = '--latency 0.01',
+            help = 'options for fakejunos.py (default --latency 0.01)')
+    parser.add_argument('netexec', nargs = REMAINDER,
+            help = 'extra netexec options, after --')
+    args = parser.parse_args()
+    if args.netexec[:1] == ['--']:
+        args.netexec = args.netexec[1:]
+
+    print('devices'.rjust(8) + 'ok'.rjust(8) + 'seconds'.rjust(10) + \
+            'dev/min'.rjust(10) + 'lines/s'.rjust(10) + 'rss MB'.rjust(9))
+    for devices in [int(x) for x in args.devices.split(',')]:
+        with TemporaryDirectory() as workdir:
+            seconds, rss, records = run_netexec(args, devices, workdir)
+        ok = [x for x in records if x['type'] == 'device' and
+                x['status'] == 'ok']
+        lines = [x for x in records if x['type'] == 'command' and
+                x['status'] == 'ok' and x['command'].startswith('set int')]
+        print(str(devices).rjust(8) + str(len(ok)).rjust(8) + \
+                '{:10.2f}'.format(seconds) + \
+                '{:10.1f}'.format(len(ok) * 60 / seconds) + \
+                '{:10.1f}'.format(len(lines) / seconds) + \
+                '{:9.1f}'.format(rss))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,3 @@
 __version__ = '0.1'
 __author__ = 'Dan Persons <dpersonsdev@gmail.com>'
 __license__ = 'MIT License'
-
-import netexec.devicetypes
@@ -0,0 +1,182 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The async engine runs the same session steps as the blocking engine
+# (the *_steps methods in devicetypes/type.py). Each device type gets a
+# subclass whose wait_for(), pause() and close() await instead of block,
+# so thousands of sessions can wait on one event loop.
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+from time import time
+from netexec.devicetypes.type import DeviceTypeModule
+
+closethreads = 256 # most sessions closed at once
+sessionclasses = {} # device type class: its async session class
+
+
+class UnsupportedType(Exception):
+    """A device type replaces session steps the async engine runs itself"""
+    pass
+
+
+class AsyncSteps:
+
+    def spawn(self, device, command='ssh'):
+        """Start the connection command for a device"""
+        super().spawn(device, command=command)
+        # pexpect's close() sleeps while the child exits. pexpect also
+        # calls it from the event loop itself when the child hangs up, so
+        # the session's close is replaced with one that runs in a thread.
+        self.closing = None
+        self.closenow = self.px.close
+        self.px.close = self.close_later
+
+
+    def close_later(self, force=True):
+        """Start closing the session in a thread, once; return a future"""
+        if self.closing is None:
+            self.closing = asyncio.get_running_loop().run_in_executor(
+                    None, self.closenow, force)
+        return self.closing
+
+
+    async def close(self):
+        """Close the session without blocking the event loop"""
+        await self.close_later()
+
+
+    async def wait_for(self, patterns, timeout=None):
+        """Wait for one of a list of patterns, using compiled patterns"""
+        if timeout is None:
+            timeout = self.timeout
+        # Output is only read while waiting, so always wait a little
+        return await self.px.expect_list(self.compile_patterns(patterns),
+                timeout=timeout or 0.01, async_=True)
+
+
+    async def pause(self, seconds):
+        """Wait a number of seconds"""
+        await asyncio.sleep(seconds)
+
+
+    def interrupted(self):
+        """Stop on KeyboardInterrupt; there is no terminal to hand over"""
+        raise KeyboardInterrupt
+
+
+def session_class(devicetype):
+    """Return the async session class for a device type class"""
+    if devicetype not in sessionclasses:
+        for name in ('connect', 'configure', 'execute'):
+            if getattr(devicetype, name) is not \
+                    getattr(DeviceTypeModule, name):
+                raise UnsupportedType('Device type ' + \
+                        devicetype.__module__.split('.')[-1] + \
+                        ' has its own ' + name + '(), which --async ' + \
+                        "can't run")
+        sessionclasses[devicetype] = type('Async' + devicetype.__name__,
+                (AsyncSteps, devicetype), {})
+    return sessionclasses[devicetype]
+
+
+async def run_device(core, entry):
+    """Connect to a device and enter lines"""
+    start = time()
+    if core.confirm_expired(entry, start):
+        return
+    try:
+        session = core.new_session(entry, wrap=session_class)
+    except KeyError:
+        core.device_skipped(entry, start, 'error',
+                'unknown device type: ' + entry['devicetype'])
+        return
+    except UnsupportedType as error:
+        core.device_skipped(entry, start, 'error', str(error))
+        return
+    session.interactive = False
+    try:
+        if await session.connect_steps(entry['device'],
+                **core.connect_options(entry)):
+            if core.args.execmode:
+                await session.execute_steps(commands=core.lines)
+            else:
+                await session.configure_steps(**core.configure_options())
+    except Exception as error:
+        # Record the device as failed, instead of losing it with its task
+        session.status = 'error'
+        session.failure = type(error).__name__ + ': ' + str(error)
+        session.end_phase()
+        session.output('==== Error: ' + session.failure + ' ====')
+        if session.px:
+            try:
+                await session.close()
+            except Exception:
+                # Still record the device, and close its sinks
+                pass
+    core.device_done(session, start)
+
+
+def task_done(core, entry, start, task):
+    """Record a device whose task failed before it recorded itself"""
+    if task.cancelled() or not task.exception():
+        return
+    error = task.exception()
+    core.device_skipped(entry, start, 'error',
+            type(error).__name__ + ': ' + str(error))
+
+
+async def run_devices(core, devices, limit):
+    """Run devices from one event loop, limit sessions at once"""
+    # Closing sessions sleeps in pexpect, so it runs in threads; the
+    # default pool is sized for CPU work, not this
+    asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=min(limit, closethreads)))
+    semaphore = asyncio.Semaphore(limit)
+    tasks = set()
+    work = core.new_work(devices)
+    while tasks or not work.exhausted():
+        await semaphore.acquire()
+        entry = work.next_device()
+        if entry is None:
+            # Nothing ready: wait for a session to finish, or for the
+            # next retry or rate limit token to be due
+            semaphore.release()
+            if tasks:
+                await asyncio.wait(tasks, timeout=work.wait_time(),
+                        return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(work.wait_time() or 0)
+            continue
+        task = asyncio.ensure_future(run_device(core, entry))
+        task.add_done_callback(functools.partial(task_done, core, entry,
+            time()))
+        task.add_done_callback(lambda t: semaphore.release())
+        task.add_done_callback(lambda t, entry=entry: work.finished(entry))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+def run(core, devices, limit):
+    """Run devices with the asyncio engine"""
+    asyncio.run(run_devices(core, devices, limit))
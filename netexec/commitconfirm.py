@@ -0,0 +1,102 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# A fleet commit in two phases. Phase one loads the config on every
+# device and commits it with 'commit confirmed N', so each device rolls
+# back on its own unless it is confirmed within N minutes. Phase two
+# connects to the devices that committed and runs the plain commit to
+# confirm. A device that can't be reached (or broke its own management
+# access) in phase two rolls back by itself. Each device's timer starts
+# when its own commit confirmed is sent, and phase two skips a device as
+# expired if its timer runs out before it could be confirmed.
+
+from threading import Lock
+from time import time
+import netexec.results
+
+
+class CommitCoordinator(netexec.results.Listener):
+
+    def __init__(self, minutes):
+        """Initialize a two-phase commit confirmed coordinator"""
+        self.minutes = minutes
+        self.phase = 'confirmed' # then 'confirm'
+        self.pending = [] # (entry, commit time) waiting for phase two
+        self.deadlines = {} # device: time its commit rolls back
+        self.counts = {} # device status: count, for the current phase
+        self.lock = Lock()
+
+
+    def device_done(self, record):
+        """Take the record for a finished device"""
+        if record.get('retry'):
+            return
+        with self.lock:
+            self.counts[record['status']] = \
+                    self.counts.get(record['status'], 0) + 1
+
+
+    def committed(self, entry, committime):
+        """Note a device that committed in phase one, and when"""
+        with self.lock:
+            self.pending.append((entry, committime))
+            self.deadlines[entry['device']] = committime + self.minutes * 60
+
+
+    def expired(self, entry, margin=0):
+        """Return True if a device rolls back within margin seconds"""
+        deadline = self.deadlines.get(entry['device'])
+        return deadline is not None and time() + margin >= deadline
+
+
+    def report(self):
+        """Return a status report for the current phase"""
+        with self.lock:
+            counts = dict(self.counts)
+        if self.phase == 'confirmed':
+            title = 'Phase 1: commit confirmed ' + str(self.minutes)
+        else:
+            title = 'Phase 2: confirm'
+        lines = ['==== ' + title + ' ====']
+        for status in sorted(counts):
+            lines.append(status.ljust(12) + str(counts[status]).rjust(8))
+        if self.phase == 'confirmed':
+            lines.append('to confirm'.ljust(12) + \
+                    str(len(self.pending)).rjust(8))
+        elif counts.get('ok', 0) < sum(counts.values()):
+            lines.append('Devices not confirmed roll back ' + \
+                    'on their own within ' + str(self.minutes) + \
+                    ' minutes of their commit.')
+        return '\n'.join(lines)
+
+
+    def start_confirm(self, margin=0):
+        """Move to phase two; return (devices to confirm, expired devices)"""
+        # A device whose timer ran out has already rolled back
+        with self.lock:
+            self.phase = 'confirm'
+            self.counts = {}
+            entries = [x[0] for x in self.pending]
+            self.pending = []
+        waiting = [x for x in entries if not self.expired(x, margin)]
+        expired = [x for x in entries if self.expired(x, margin)]
+        return waiting, expired
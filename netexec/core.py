@@ -24,13 +24,19 @@
 
 from argparse import ArgumentParser
 from sys import exit
-from os import environ
 from getpass import getpass
-import pexpect
-import re
-from time import sleep
-from os.path import isfile
+from time import sleep, time
+from os.path import isfile, join
 import netexec.devicetypes
+import netexec.pacing
+import netexec.sinks
+import netexec.results
+import netexec.stats
+import netexec.inventory
+import netexec.journal
+import netexec.scheduler
+import netexec.timeouts
+import netexec.commitconfirm
 import gettext
 gettext.install('netexec')
 
@@ -44,6 +50,11 @@ class NetExecCore:
         """Initialize the program"""
         self.args = None
         self.devicetypes = {}
+        self.lines = []
+        self.listeners = []
+        self.coordinator = None # for --commit-confirmed
+        self.commitphase = None # 'confirmed', then 'confirm'
+        self.waves = None # for --waves (scheduler.WaveBudget)
 
 
     def get_args(self):
@@ -62,7 +73,8 @@ class NetExecCore:
                 help = 'use a password (will prompt; DO NOT enter as arg)')
         parser.add_argument('-c',
                 action = 'store', dest = 'command', default = 'ssh',
-                help = 'command to connect (default ssh)')
+                help = 'command to connect (default ssh; run directly, ' + \
+                        'not through a shell)')
         modeparser = parser.add_mutually_exclusive_group()
         modeparser.add_argument('-x', '--exec-mode',
                 action = 'store_true', dest = 'execmode',
@@ -70,6 +82,15 @@ class NetExecCore:
         modeparser.add_argument('--commit',
                 action = 'store_true',
                 help = 'commit config and exit (no interactive mode')
+        parser.add_argument('--commit-confirmed',
+                action = 'store', dest = 'commitconfirmed', type = int,
+                metavar = 'MINUTES',
+                help = 'commit with commit confirmed on all devices, ' + \
+                        'then confirm on all that still answer')
+        parser.add_argument('--confirm-workers',
+                action = 'store', dest = 'confirmworkers', type = int,
+                help = 'set the number of devices to confirm at once ' + \
+                        '(default -w)')
         parser.add_argument('-d',
                 action = 'store', dest = 'devicetype', default = 'junos',
                 help = 'set the device type (junos, ios, etc)')
@@ -86,9 +107,148 @@ class NetExecCore:
                 help = 'set the timeout for spawning and sending lines')
         deviceparser.add_argument('-l',
                 action = 'store', dest = 'devicelist',
-                help = 'connect to all devices in specified list file')
+                help = 'connect to all devices in specified list file ' + \
+                        '(or .csv/.yaml inventory)')
         deviceparser.add_argument('device', action='store', nargs = '?',
                 help='specify a device to which to connect')
+        parser.add_argument('--shard',
+                action = 'store', dest = 'shard',
+                help = 'only run devices in slice i of N (i/N, from ' + \
+                        '1/N); split by a stable hash of the device name')
+        parser.add_argument('-w', '--workers',
+                action = 'store', dest = 'workers', type = int, default = 1,
+                help = 'set the number of devices to run at once ' + \
+                        '(more than 1 disables interactive mode)')
+        parser.add_argument('--rate-limit',
+                action = 'store', dest = 'ratelimit', type = float,
+                help = 'start at most this many sessions per second')
+        parser.add_argument('--rate-burst',
+                action = 'store', dest = 'rateburst', type = float,
+                help = 'let this many sessions start at once before ' + \
+                        '--rate-limit applies (default 1)')
+        parser.add_argument('--group-limit',
+                action = 'append', dest = 'grouplimit', metavar = 'ATTR=N',
+                help = 'run at most N devices at once per value of an ' + \
+                        'inventory column (e.g. site=4, devicetype=10)')
+        parser.add_argument('--waves',
+                action = 'store_true', dest = 'waves',
+                help = 'roll out in waves that grow from a canary, ' + \
+                        'and stop if too many devices fail')
+        parser.add_argument('--canary',
+                action = 'store', dest = 'canary', type = int, default = 1,
+                help = 'set the size of the first wave (default 1)')
+        parser.add_argument('--wave-growth',
+                action = 'store', dest = 'wavegrowth', type = float,
+                default = 10,
+                help = 'multiply each wave size by this (default 10)')
+        parser.add_argument('--failure-budget',
+                action = 'store', dest = 'failurebudget', type = float,
+                default = 0.05,
+                help = 'stop starting devices once more than this ' + \
+                        'share of them fail (default 0.05)')
+        parser.add_argument('--retry',
+                action = 'append', dest = 'retry', metavar = 'CLASS=N',
+                help = 'set retries for a failure class: auth, ' + \
+                        'connect, config, exec, device (default ' + \
+                        'auth=0, connect=2, config=0, exec=1, device=0)')
+        parser.add_argument('--retry-backoff',
+                action = 'store', dest = 'retrybackoff', type = float,
+                default = 2.0,
+                help = 'set the base retry delay in seconds; it doubles ' + \
+                        'with each attempt, with jitter (default 2)')
+        parser.add_argument('--probe',
+                action = 'store_true', dest = 'probe',
+                help = 'check each device port with a quick TCP ' + \
+                        'connection first, skipping (or retrying) ' + \
+                        'devices that are down')
+        parser.add_argument('--probe-port',
+                action = 'store', dest = 'probeport', type = int,
+                default = 22,
+                help = 'set the port to probe, if the inventory ' + \
+                        "doesn't set one (default 22; a port given " + \
+                        "in -c, like 'ssh -p 2222', is not seen)")
+        parser.add_argument('--probe-timeout',
+                action = 'store', dest = 'probetimeout', type = float,
+                default = 3.0,
+                help = 'set the probe connect timeout in seconds ' + \
+                        '(default 3)')
+        parser.add_argument('--timeout-store',
+                action = 'store', dest = 'timeoutstore',
+                help = 'learn round trip times per device and command ' + \
+                        'in this file, and set timeouts from them ' + \
+                        '(-t until there is enough history)')
+        parser.add_argument('--timeout-margin',
+                action = 'store', dest = 'timeoutmargin', type = float,
+                default = 3.0,
+                help = 'multiply p99 round trip times by this for ' + \
+                        'learned timeouts (default 3)')
+        parser.add_argument('--timeout-floor',
+                action = 'store', dest = 'timeoutfloor', type = float,
+                default = 5.0,
+                help = 'set the shortest learned timeout in seconds ' + \
+                        '(default 5)')
+        parser.add_argument('--timeout-ceiling',
+                action = 'store', dest = 'timeoutceiling', type = float,
+                default = 300.0,
+                help = 'set the longest learned timeout in seconds ' + \
+                        '(default 300)')
+        parser.add_argument('--pacing',
+                action = 'store', dest = 'pacing',
+                choices = netexec.pacing.pacingtypes,
+                help = 'set the delay policy between lines ' + \
+                        '(default set by device type)')
+        parser.add_argument('--delay',
+                action = 'store', dest = 'delay', type = float,
+                help = 'set the fixed (or most adaptive) delay in seconds')
+        parser.add_argument('--window',
+                action = 'store', dest = 'window', type = int,
+                help = 'send up to this many config lines before ' + \
+                        'waiting for their prompts (pipelined mode)')
+        parser.add_argument('--bulk',
+                action = 'store', dest = 'bulk', choices = ['set', 'merge'],
+                help = 'load the input file in one bulk config load ' + \
+                        '(load set/merge terminal on junos)')
+        parser.add_argument('-o', '--output',
+                action = 'store', dest = 'output',
+                choices = netexec.sinks.sinktypes,
+                help = 'set where device output goes (default stdout, ' + \
+                        'or prefix with more than 1 worker)')
+        parser.add_argument('--output-dir',
+                action = 'store', dest = 'outputdir', default = '.',
+                help = 'set the directory for -o files (default .)')
+        parser.add_argument('--results',
+                action = 'store', dest = 'results',
+                help = 'append a JSON record per command and per ' + \
+                        'device to this file (JSONL)')
+        parser.add_argument('--stats',
+                action = 'store_true', dest = 'stats',
+                help = 'print phase timing percentiles and the ' + \
+                        'slowest devices at the end')
+        parser.add_argument('--journal',
+                action = 'store', dest = 'journal',
+                help = 'append each finished device to this file ' + \
+                        '(synced to disk as it goes)')
+        parser.add_argument('--resume',
+                action = 'store_true', dest = 'resume',
+                help = 'skip devices the --journal file has as done ' + \
+                        'with the same input and mode')
+        parser.add_argument('--record',
+                action = 'store', dest = 'record',
+                help = 'capture each session (timed bytes sent and ' + \
+                        'received) to a file in this directory')
+        parser.add_argument('--replay',
+                action = 'store', dest = 'replay',
+                help = 'play sessions back from captures in this ' + \
+                        'directory instead of connecting')
+        parser.add_argument('--replay-speed',
+                action = 'store', dest = 'replayspeed', type = float,
+                default = 1.0,
+                help = 'set the replay speed factor (default 1.0; ' + \
+                        '0 for as fast as possible)')
+        parser.add_argument('--async',
+                action = 'store_true', dest = 'asyncmode',
+                help = 'run sessions from one asyncio event loop ' + \
+                        '(no interactive mode; -w sets the session limit)')
 
         self.args = parser.parse_args()
 
@@ -101,38 +261,165 @@ class NetExecCore:
         else:
             self.password = None
 
-        # Set up device list
+        # Set up device list (read lazily as devices are run)
         self.devicelist = []
         if self.args.devicelist:
             self.read_devices()
         else:
-            self.devicelist.append(self.args.device)
+            self.devicelist.append({'device': self.args.device})
+        if self.args.shard:
+            try:
+                index, count = netexec.inventory.parse_shard(self.args.shard)
+            except ValueError as err:
+                print(str(err) + '.')
+                exit(1)
+            self.devicelist = netexec.inventory.shard(self.devicelist,
+                    index, count)
         if self.args.input:
             self.read_input()
 
+        # Set up a two-phase commit
+        if self.args.commitconfirmed:
+            if self.args.execmode:
+                print('--commit-confirmed commits config; not with -x.')
+                exit(1)
+            self.args.commit = True
+            self.commitphase = 'confirmed'
+            self.coordinator = netexec.commitconfirm.CommitCoordinator(
+                    self.args.commitconfirmed)
+            self.listeners.append(self.coordinator)
+
+        # Set up waves
+        if self.args.waves:
+            if self.args.canary < 1 or self.args.wavegrowth < 1:
+                print('Waves need a canary of at least 1 and a growth ' + \
+                        'of at least 1.')
+                exit(1)
+            self.waves = netexec.scheduler.WaveBudget(
+                    budget=self.args.failurebudget,
+                    canary=self.args.canary, growth=self.args.wavegrowth)
+            self.listeners.append(self.waves)
+
+        # Set up the retry queue
+        try:
+            limits = netexec.scheduler.parse_limits(self.args.retry)
+        except ValueError as err:
+            print(str(err) + '.')
+            exit(1)
+        self.retries = netexec.scheduler.RetryQueue(limits,
+                base=self.args.retrybackoff)
+
+        # Set up limits on starting sessions
+        self.bucket = None
+        if self.args.ratelimit:
+            if self.args.ratelimit < 0 or (self.args.rateburst or 1) < 1:
+                print('--rate-limit must be positive and --rate-burst ' + \
+                        'at least 1.')
+                exit(1)
+            self.bucket = netexec.scheduler.TokenBucket(self.args.ratelimit,
+                    self.args.rateburst)
+        try:
+            self.groups = netexec.scheduler.parse_group_limits(
+                    self.args.grouplimit,
+                    {'devicetype': self.args.devicetype})
+        except ValueError as err:
+            print(str(err) + '.')
+            exit(1)
+
+        # Set up learned timeouts (which learn as a listener)
+        self.timeouts = None
+        if self.args.timeoutstore:
+            try:
+                self.timeouts = netexec.timeouts.TimeoutStore(
+                        self.args.timeoutstore,
+                        margin=self.args.timeoutmargin,
+                        floor=self.args.timeoutfloor,
+                        ceiling=self.args.timeoutceiling)
+            except ValueError:
+                print('Timeout store is not valid JSON: ' + \
+                        self.args.timeoutstore + '.')
+                exit(1)
+            self.listeners.append(self.timeouts)
+
+        # Set up result listeners
+        if self.args.results:
+            self.listeners.append(
+                    netexec.results.ResultWriter(self.args.results))
+        if self.args.stats:
+            self.listeners.append(netexec.stats.StatsCollector())
+        if self.args.resume and not self.args.journal:
+            print('--resume needs a --journal file.')
+            exit(1)
+        if self.args.journal:
+            journal = netexec.journal.Journal(self.args.journal,
+                    netexec.journal.input_hash(self.lines, self.mode()),
+                    resume=self.args.resume)
+            self.devicelist = journal.pending(self.devicelist)
+            self.listeners.append(journal)
+
+        # Probe devices ahead of their sessions (there is nothing to probe
+        # when replaying captures)
+        if self.args.probe and not self.args.replay:
+            # Imported here so only probing runs load asyncio
+            import netexec.probe as probe
+            prober = probe.Prober(port=self.args.probeport,
+                    timeout=self.args.probetimeout,
+                    chunksize=max(256, self.args.workers * 4))
+            self.devicelist = prober.reachable(self.devicelist,
+                    self.device_unreachable)
+
+
+    def mode(self):
+        """Return a name for the mode lines run in (for the journal)"""
+        if self.args.execmode:
+            return 'exec'
+        elif self.args.bulk:
+            return 'bulk-' + self.args.bulk + \
+                    ('-commit' if self.args.commit else '')
+        elif self.args.commitconfirmed:
+            return 'commit-confirmed'
+        elif self.args.commit:
+            return 'commit'
+        else:
+            return 'config'
+
 
     def list_devicetypes(self, *args):
         """Return a list of available device type modules"""
         print('==== Available device type modules: ====\n')
-        for devicetype in sorted(self.devicetypes):
-            print(self.devicetypes[devicetype].name.ljust(16) + \
-                ': ' + self.devicetypes[devicetype].desc)
+        devicetypes = netexec.devicetypes.available()
+        for devicetype in sorted(devicetypes):
+            print(devicetype.ljust(16) + ': ' + devicetypes[devicetype])
         exit(0)
     
-    def load_devicetypes(self):
-        """Load device type module(s)"""
-        for devicetype in sorted(netexec.devicetypes.__all__):
-            self.devicetypes[devicetype] = \
-                __import__('netexec.devicetypes.' + devicetype, globals(), \
-                locals(), [netexec]).DeviceTypeModule()
+    def load_devicetype(self, devicetype):
+        """Import the selected device type module (and pexpect with it)"""
+        try:
+            return self.devicetype_class(devicetype)
+        except KeyError:
+            print('Unknown device type: ' + devicetype + \
+                    ' (see --list-types).')
+            exit(1)
+
+
+    def devicetype_class(self, devicetype):
+        """Return a device type's module class, importing it on first use"""
+        if devicetype not in self.devicetypes:
+            self.devicetypes[devicetype] = netexec.devicetypes.load(devicetype)
+        return self.devicetypes[devicetype]
 
 
     def read_devices(self):
         """Read lines from device list file"""
         if self.args.devicelist:
             if isfile(self.args.devicelist):
-                with open(self.args.devicelist, 'r') as f:
-                    self.devicelist = [x.rstrip() for x in f.readlines()]
+                try:
+                    self.devicelist = netexec.inventory.unique(
+                            netexec.inventory.read_inventory(
+                                self.args.devicelist))
+                except ValueError as err:
+                    print(str(err) + '.')
+                    exit(1)
             else:
                 print('Device list file not found: ' + \
                         self.args.devicelist + '.')
@@ -154,16 +441,289 @@ class NetExecCore:
             print('No input file specified; will go interactive right away.')
 
 
-    def connect_devices(self):
-        """Connect to devices and execute"""
-        con = self.devicetypes[self.args.devicetype]
-        for device in self.devicelist:
-            con.connect(device, user=self.args.user, password=self.password,
-                    timeout=self.args.timeout, command=self.args.command)
+    def new_session(self, entry, wrap=None):
+        """Return a new device type module instance for one session"""
+        # Raises KeyError for an unknown device type. wrap, if given,
+        # returns the class to use for a device type class.
+        devicetype = entry.get('devicetype', self.args.devicetype)
+        device = entry['device']
+        sessionclass = self.devicetype_class(devicetype)
+        if wrap:
+            sessionclass = wrap(sessionclass)
+        session = sessionclass(
+                user=entry.get('user', self.args.user),
+                password=self.password, timeout=self.args.timeout)
+        session.port = entry.get('port')
+        session.timeouts = self.timeouts
+        session.inventory = entry
+        session.sink = self.new_sink(device)
+        capturename = device.replace('/', '_') + '.capture'
+        if self.args.record:
+            session.record = join(self.args.record, capturename)
+        if self.args.replay:
+            session.replay = join(self.args.replay, capturename)
+            session.replayspeed = self.args.replayspeed
+        if self.args.pacing:
+            session.pacing = self.args.pacing
+        if self.args.delay is not None:
+            session.pacingdelay = self.args.delay
+        if self.args.window:
+            session.window = self.args.window
+        session.listeners = self.listeners
+        return session
+
+
+    def new_sink(self, device):
+        """Return an output sink for a device"""
+        sinktype = self.args.output
+        if not sinktype:
+            if self.args.workers > 1 or self.args.asyncmode:
+                sinktype = 'prefix'
+            else:
+                sinktype = 'stdout'
+        return netexec.sinks.new_sink(sinktype, device,
+                outputdir=self.args.outputdir)
+
+
+    def connect_options(self, entry):
+        """Return connect() keyword arguments for an inventory entry"""
+        return {
+                'user': entry.get('user', self.args.user),
+                'password': self.password,
+                'timeout': self.args.timeout,
+                'command': entry.get('command', self.args.command),
+                'sendyes': self.args.yes
+                }
+
+
+    def configure_options(self):
+        """Return configure() keyword arguments for the commit phase"""
+        if self.commitphase == 'confirm':
+            # Nothing to load; the commit confirms the one from phase one
+            return {'commands': None, 'commit': True, 'confirming': True}
+        return {
+                'commands': self.lines,
+                'commit': self.args.commit,
+                'bulk': self.args.bulk,
+                'confirmed': self.args.commitconfirmed
+                }
+
+
+    def confirm_expired(self, entry, start):
+        """Skip a phase 2 device if its commit rolls back too soon"""
+        # Leave a timeout's worth of time to log in and confirm
+        if self.commitphase != 'confirm' or \
+                not self.coordinator.expired(entry, self.args.timeout):
+            return False
+        self.device_skipped(entry, start, 'expired',
+                'commit confirmed runs out before it can be confirmed')
+        return True
+
+
+    def run_device(self, entry):
+        """Connect to a device and enter lines"""
+        start = time()
+        if self.confirm_expired(entry, start):
+            return
+        try:
+            session = self.new_session(entry)
+        except KeyError:
+            self.device_skipped(entry, start, 'error',
+                    'unknown device type: ' + entry['devicetype'])
+            return
+        if self.args.workers > 1:
+            session.interactive = False
+        if session.connect(entry['device'], **self.connect_options(entry)):
             if self.args.execmode:
-                con.execute(commands=self.lines)
+                session.execute(commands=self.lines)
             else:
-                con.configure(commands=self.lines, commit=self.args.commit)
+                session.configure(**self.configure_options())
+        self.device_done(session, start)
+
+
+    def device_done(self, session, start):
+        """Close a finished session's output and record its result"""
+        # Send failed devices back to the pool, if their class allows it
+        failclass = session.failure_class()
+        attempt = self.retries.attempt(session.inventory)
+        delay = self.retries.schedule(session.inventory, failclass)
+        if delay is not None:
+            session.output('==== Retrying (' + failclass + ' failure) in ' + \
+                    '{:.1f}'.format(delay) + 's ====')
+        elif self.commitphase == 'confirmed' and session.status == 'ok':
+            # A device type with its own configure() doesn't note the
+            # commit time; its session start is an early enough bound
+            self.coordinator.committed(session.inventory,
+                    session.committime or start)
+        session.sink.close()
+        if session.capture:
+            session.capture.close()
+        record = {
+                'type': 'device',
+                'device': session.device,
+                'devicetype': session.name,
+                'output': session.sink.location,
+                'status': session.status,
+                'error': session.failure or None,
+                'class': failclass,
+                'attempt': attempt,
+                'retry': delay is not None,
+                'commitphase': self.commitphase,
+                'commands': session.commandcount,
+                'bytes': session.reads.total if session.reads else 0,
+                'start': start,
+                'end': time()
+                }
+        for listener in self.listeners:
+            listener.device_done(record)
+
+
+    def device_skipped(self, entry, start, status, error, failclass=None):
+        """Record the result for a device that never got a session"""
+        attempt = self.retries.attempt(entry)
+        delay = self.retries.schedule(entry, failclass)
+        if delay is None:
+            print('==== ' + entry['device'] + ': ' + error + '; skipping ====')
+        else:
+            print('==== ' + entry['device'] + ': ' + error + \
+                    '; retrying in ' + '{:.1f}'.format(delay) + 's ====')
+        record = {
+                'type': 'device',
+                'device': entry['device'],
+                'devicetype': entry.get('devicetype', self.args.devicetype),
+                'output': None,
+                'status': status,
+                'error': error,
+                'class': failclass,
+                'attempt': attempt,
+                'retry': delay is not None,
+                'commitphase': self.commitphase,
+                'commands': 0,
+                'bytes': 0,
+                'start': start,
+                'end': time()
+                }
+        for listener in self.listeners:
+            listener.device_done(record)
+
+
+    def device_unreachable(self, entry, error):
+        """Skip a device that failed the pre-flight probe, or retry it"""
+        # Unresolvable names won't get better with time
+        if error.startswith('could not resolve'):
+            failclass = 'auth'
+        else:
+            failclass = 'connect'
+        self.device_skipped(entry, time(), 'unreachable', error, failclass)
+
+
+    def halted(self):
+        """Return True if a rollout has gone over its failure budget"""
+        return bool(self.waves and self.commitphase != 'confirm' and
+                self.waves.exceeded())
+
+
+    def run_devices(self):
+        """Run the device list, in waves if asked; False if halted"""
+        if not self.waves:
+            self.connect_devices()
+            return True
+        for number, wave in enumerate(self.waves.waves(self.devicelist), 1):
+            self.devicelist = wave
+            self.connect_devices()
+            print(self.waves.report(number))
+            if self.waves.halted or self.waves.exceeded():
+                print('==== Failure budget exceeded: halting ====')
+                return False
+        return True
+
+
+    def commit_confirmed(self):
+        """Commit confirmed on all devices, then confirm where we can"""
+        halted = not self.run_devices()
+        print(self.coordinator.report())
+        if halted:
+            # Let every commit from this run roll back
+            print('==== Not confirming: committed devices roll back ' + \
+                    'within ' + str(self.args.commitconfirmed) + \
+                    ' minutes ====')
+            return
+        self.commitphase = 'confirm'
+        self.devicelist, expired = self.coordinator.start_confirm(
+                self.args.timeout)
+        for entry in expired:
+            self.device_skipped(entry, time(), 'expired',
+                    'commit confirmed runs out before it can be confirmed')
+        self.connect_devices(self.args.confirmworkers or self.args.workers)
+        print(self.coordinator.report())
+
+
+    def new_work(self, devices):
+        """Return a work queue for devices, with retries and limits"""
+        return netexec.scheduler.WorkQueue(devices, self.retries,
+                self.halted, self.bucket, self.groups)
+
+
+    def run_work(self, work, entry):
+        """Run a device from a work queue, then free its group slots"""
+        try:
+            self.run_device(entry)
+        finally:
+            work.finished(entry)
+
+
+    def connect_devices(self, workers=None):
+        """Connect to devices and execute"""
+        workers = workers or self.args.workers
+        if self.args.asyncmode:
+            # Imported here so only --async runs load asyncio
+            import netexec.asyncengine as asyncengine
+            asyncengine.run(self, self.devicelist, workers)
+        elif workers > 1:
+            from concurrent.futures import ThreadPoolExecutor, wait, \
+                    FIRST_COMPLETED
+            # Submit devices as workers free up, so the list is never
+            # read ahead of the pool, and retries run alongside fresh work
+            work = self.new_work(self.devicelist)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                running = set()
+                while running or not work.exhausted():
+                    entry = None
+                    if len(running) < workers:
+                        entry = work.next_device()
+                    if entry is not None:
+                        running.add(pool.submit(self.run_work, work, entry))
+                        continue
+                    # Wait for a worker, or for the next retry or token
+                    if len(running) < workers:
+                        timeout = work.wait_time()
+                    else:
+                        timeout = None
+                    if running:
+                        done, running = wait(running, timeout=timeout,
+                                return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+                    else:
+                        sleep(work.wait_time() or 0)
+        else:
+            work = self.new_work(self.devicelist)
+            while not work.exhausted():
+                entry = work.next_device()
+                if entry is None:
+                    sleep(work.wait_time() or 0)
+                else:
+                    self.run_work(work, entry)
+
+
+    def check_async(self, devicetype):
+        """Exit if a device type can't run with the async engine"""
+        import netexec.asyncengine as asyncengine
+        try:
+            asyncengine.session_class(devicetype)
+        except asyncengine.UnsupportedType as err:
+            print(str(err) + '.')
+            exit(1)
 
 
     def run_script(self):
@@ -171,11 +731,22 @@ class NetExecCore:
         try:
             self.get_args()
             self.setup()
-            self.load_devicetypes()
             if self.args.list_types:
                 self.list_devicetypes()
             else:
-                self.connect_devices()
+                # Import the device type before any workers start
+                devicetype = self.load_devicetype(self.args.devicetype)
+                if self.args.asyncmode:
+                    self.check_async(devicetype)
+                try:
+                    if self.coordinator:
+                        self.commit_confirmed()
+                    else:
+                        self.run_devices()
+                finally:
+                    # Save results and learned timeouts, even on Ctrl-C
+                    for listener in self.listeners:
+                        listener.close()
 
         except KeyboardInterrupt:
             print('\nExiting on KeyboardInterrupt')
@@ -20,7 +20,77 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-__all__ = ['junos', 'blank']
+from importlib import import_module
+from os import listdir
+from os.path import isdir, join
+import sys
 
-import netexec.devicetypes.blank
-import netexec.devicetypes.junos
+# Built-in device types and their descriptions. Modules are only
+# imported when a session needs one (importing any of them pulls in
+# pexpect), so keep these descriptions in step with each module's desc.
+builtins = {
+        'blank': 'a blank devicetype module',
+        'junos': 'juniper networks junos'
+        }
+
+__all__ = sorted(builtins)
+
+# Other packages can add device types with an entry point in this group,
+# pointing at a module with a DeviceTypeModule class, or at the class
+entrypointgroup = 'netexec.devicetypes'
+
+
+def declared():
+    """Return True if any installed distribution declares our group"""
+    # importlib.metadata costs more to import than pexpect, so look for
+    # the group header in entry_points.txt files first
+    header = '[' + entrypointgroup + ']'
+    for path in sys.path:
+        if not isdir(path or '.'):
+            continue
+        for entry in listdir(path or '.'):
+            if not entry.endswith(('.dist-info', '.egg-info')):
+                continue
+            try:
+                with open(join(path, entry, 'entry_points.txt'), 'r') as f:
+                    if header in f.read():
+                        return True
+            except (IOError, OSError):
+                pass
+    return False
+
+
+def plugins():
+    """Return a dict of installed device type entry points by name"""
+    if not declared():
+        return {}
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return {}
+    try:
+        found = entry_points(group=entrypointgroup)
+    except TypeError:
+        # Python before 3.10 returns a dict of groups
+        found = entry_points().get(entrypointgroup, [])
+    return {entrypoint.name: entrypoint for entrypoint in found}
+
+
+def available():
+    """Return a dict of available device type names and descriptions"""
+    devicetypes = dict(builtins)
+    for name, entrypoint in plugins().items():
+        if name not in devicetypes:
+            devicetypes[name] = 'plugin (' + entrypoint.value + ')'
+    return devicetypes
+
+
+def load(name):
+    """Import a device type and return its DeviceTypeModule class"""
+    if name in builtins:
+        return import_module('netexec.devicetypes.' + name).DeviceTypeModule
+    entrypoint = plugins().get(name)
+    if not entrypoint:
+        raise KeyError(name)
+    loaded = entrypoint.load()
+    return getattr(loaded, 'DeviceTypeModule', loaded)
@@ -26,6 +26,8 @@ from netexec.devicetypes.type import DeviceTypeModule as OurModule
 class DeviceTypeModule(OurModule):
     def __init__(self, user=None, password=None, timeout=45):
         """Initialize a device type module"""
+        OurModule.__init__(self, user=user, password=password,
+                timeout=timeout)
         # Module information for help menus, etc
         self.name = 'blank'
         self.desc = 'a blank devicetype module'
@@ -46,8 +48,8 @@ class DeviceTypeModule(OurModule):
         self.preconfigcommands = None # List of commands to run pre-config
         self.postconfigcommands = None # List of commands to run post-config
         self.commitcommand = None # Command to commit config
-        self.configquit = None # Command to quit config mode, if needed
-        self.exitcommand = '' # Command to exit the device
+        self.configquitcommand = None # Command to quit config mode, if needed
+        self.exitcommands = [] # Commands to exit the device
 
 
     # You can define custom connect(), configure(), and exec() commands here.
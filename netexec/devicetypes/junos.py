@@ -26,6 +26,8 @@ from netexec.devicetypes.type import DeviceTypeModule as OurModule
 class DeviceTypeModule(OurModule):
     def __init__(self, user=None, password=None, timeout=45):
         """Initialize a device type module"""
+        OurModule.__init__(self, user=user, password=password,
+                timeout=timeout)
         # Module information for help menus, etc
         self.name = 'junos'
         self.desc = 'juniper networks junos'
@@ -42,6 +44,27 @@ class DeviceTypeModule(OurModule):
                 'shell': r'[a-zA-Z0-9\.\-_]+@\S+:RE:.\%'
                 } # prompts the program can expect to see
         self.promptoptions = list(self.prompts.values())
+        # Errors are printed on their own line, before the next prompt
+        self.errorpatterns = {
+                'config': [
+                    (r'\n\s*syntax error', 'abort'),
+                    (r'\n\s*unknown command', 'abort'),
+                    (r'\nerror: configuration check-out failed', 'abort'),
+                    (r'\nerror: commit failed', 'abort'),
+                    (r'load complete \(\d+ errors?\)', 'abort')
+                    ],
+                'exec': [
+                    (r'\n\s*syntax error', 'skip'),
+                    (r'\n\s*unknown command', 'skip')
+                    ]
+                }
+        # After login, match only this device's own user@host prompt,
+        # at the start of a line
+        self.promptlearnrex = r'(?P<base>[a-zA-Z0-9\.\-_]+@[a-zA-Z0-9\.\-_]+)[>#]'
+        self.learnedprompts = {
+                'exec': r'\n{}>\s?',
+                'config': r'\n{}#\s?'
+                }
 
         self.disablepaging = [
                 'set cli screen-length 0',
@@ -51,10 +74,23 @@ class DeviceTypeModule(OurModule):
         self.preconfigcommands = None
         self.postconfigcommands = ['show | compare']
         self.commitcommand = 'commit and-quit'
+        # Stays in config mode; the exit command leaves it
+        self.commitconfirmedcommand = 'commit confirmed {}'
+        self.confirmpendingcommand = 'show system commit'
+        self.confirmpendingrex = r'commit confirmed, rollback in'
         # configquit isn't needed, since 'commit and-quit' quits config mode
         self.configquitcommand = None
         self.exitcommands = ['exit']
 
+        # Bulk loading: stream the input, then end it with ctrl-d
+        self.bulkloadcommands = {
+                'set': 'load set terminal',
+                'merge': 'load merge terminal'
+                }
+        self.bulkloadready = r'\[Type \^D at a new line to end input\]'
+        self.bulkloadend = '\x04'
+        self.bulkchunksize = 4096
+
 
     #def configure(self):
     #    """Enter lines in config mode"""
@@ -22,12 +22,51 @@
 
 from os import environ
 from sys import exit
-from time import sleep
+from time import sleep, time
 import pexpect
 import re
+import shlex
+import netexec.pacing
+import netexec.sinks
+import netexec.replay
+from io import BytesIO
+
+class TailBuffer(BytesIO):
+
+    # Bytes to keep; must be well over searchwindowsize plus a read
+    limit = 65536
+
+    def write(self, data):
+        """Write data, keeping only the last limit bytes"""
+        count = BytesIO.write(self, data)
+        if self.tell() > self.limit * 2:
+            tail = self.getvalue()[-self.limit:]
+            self.seek(0)
+            self.truncate()
+            BytesIO.write(self, tail)
+        return count
+
+
+class DeviceError(Exception):
+    """A device answered with an error matched by an 'abort' pattern"""
+    pass
+
+
+def run_steps(steps):
+    """Run session steps (a coroutine) that never wait on an event loop"""
+    try:
+        steps.send(None)
+    except StopIteration as done:
+        return done.value
+    steps.close()
+    raise RuntimeError('session steps tried to wait on an event loop')
+
 
 class DeviceTypeModule:
-    def __init__(self):
+    # Compiled pattern lists, shared by every session of every device type
+    compiledpatterns = {}
+
+    def __init__(self, user=None, password=None, timeout=45):
         """Initialize a device type module"""
         # Module information for help menus, etc
         self.name = ''
@@ -38,6 +77,24 @@ class DeviceTypeModule:
         self.timeout = timeout
         self.usernamerex = r'Username:' # regex for username prompt
         self.passwordrex = r'Password:' # regex for password prompt
+        self.hostkeyrex = r'continue connecting \(yes/no' # host key question
+        self.portoption = '-p' # connect command option that sets the port
+        self.loginfailures = [
+                r'Permission denied',
+                r'Connection refused',
+                r'Connection timed out',
+                r'Connection closed by',
+                r'No route to host',
+                r'Could not resolve hostname',
+                r'Host key verification failed'
+                ] # regexes for login failures
+        # Login failures worth retrying (the rest are like bad passwords)
+        self.transientfailures = [
+                r'Connection refused',
+                r'Connection timed out',
+                r'Connection closed by',
+                r'No route to host'
+                ]
 
         self.prompts = {
                 'exec': r'[a-z\-\._]+@[a-zA-Z0-9\.\-_]+(?:>|#)\s?',
@@ -45,6 +102,15 @@ class DeviceTypeModule:
                 'shell': r'[a-z\-\._]+@[a-zA-Z0-9\.\-_]+(?:>|#)\s?'
                 } # prompts the program can expect to see
         self.promptoptions = list(self.prompts.values())
+        # Error output to match along with the prompts, by mode ('config'
+        # or 'exec'): a list of (regex, policy) pairs, where policy is
+        # 'abort' (fail the device now), 'skip' (mark the line rejected
+        # and go on) or 'continue' (note it and go on)
+        self.errorpatterns = {}
+        # Learning the exact prompt after login (None to skip): a regex with
+        # a 'base' group for the login prompt, and templates for the base
+        self.promptlearnrex = None
+        self.learnedprompts = {}
 
         self.disablepaging = [] # commands to disable paging
 
@@ -52,166 +118,689 @@ class DeviceTypeModule:
         self.preconfigcommands = None # None or a list containing preconfiguration commands
         self.postconfigcommands = None # None or a list, like above
         self.commitcommand = None
+        # Commit that rolls back unless confirmed (by commitcommand) within
+        # {} minutes; None if the device type can't
+        self.commitconfirmedcommand = None
+        # Checking that a commit confirmed is still pending before the
+        # commit that confirms it (None to skip): an exec mode command, and
+        # a regex its output matches while the rollback timer runs
+        self.confirmpendingcommand = None
+        self.confirmpendingrex = None
         self.configquitcommand = None
         self.exitcommands = ['exit']
 
+        # Bulk config loading (None or a dict of load type: command)
+        self.bulkloadcommands = None
+        self.bulkloadready = None # regex for "ready for input", if any
+        self.bulkloadend = None # sequence that ends bulk input
+        self.bulkchunksize = 4096 # bytes to write before reading echo
+
+        # Pacing after each prompt: 'none', 'fixed' or 'adaptive'
+        # (pacingdelay is the fixed delay, or the most adaptive will wait)
+        self.pacing = 'adaptive'
+        self.pacingdelay = 0.8
+        self.window = 1 # config lines to send before matching prompts
+
+        # Session settings (one module instance per device session)
+        self.px = None
+        self.interactive = True # go interactive when lines are done
+        self.logindelay = 0.05 # seconds to wait before login replies
+        self.port = None # port for the connect command (None for default)
+        self.sink = None # output sink (see sinks.py; None for stdout)
+        self.pacer = None
+        self.timeouts = None # learned timeouts (timeouts.TimeoutStore)
+        self.searchwindowsize = 2000 # bytes at the end of output to search
+        self.loginstate = {}
+        self.errormode = None # errorpatterns mode in use
+        self.failure = '' # why the last login failed
+        self.failedphase = None # phase the session failed in, if any
+
+        # Results (see results.py)
+        self.device = None
+        self.inventory = {} # inventory entry (see inventory.py)
+        # 'ok', 'timeout', 'eof', 'error', 'interrupted' or 'expired'
+        self.status = None
+        self.listeners = [] # objects to hand result records to
+        self.reads = None # counts bytes read (sinks.CountingSink)
+        self.commandcount = 0
+        self.committime = None # when commit confirmed was sent, if it was
+        self.phase = None # session phase being timed, and when it started
+        self.phasestart = None
+
+        # Session capture and replay (see replay.py)
+        self.record = None # capture file to write, if any
+        self.replay = None # capture file to play back instead of connecting
+        self.replayspeed = 1.0 # replay speed factor (0 for no delays)
+        self.capture = None
+
+
+    def output(self, message):
+        """Write a status message to the session's output sink"""
+        # Device output itself goes to the sink as it is read (logfile_read)
+        self.sink.write(b'\n' + message.encode('utf-8') + b'\n')
+        self.sink.flush()
+
+
+    def go_interactive(self):
+        """Hand the session to the user, or end it if not interactive"""
+        if self.interactive:
+            print('\n==== Interactive mode ====' + \
+                    '\nPress enter for a prompt.')
+            self.px.logfile_read = None
+            self.px.interact()
+        else:
+            self.px.close()
+
+
+    def compile_patterns(self, patterns):
+        """Return a cached, compiled pattern list for expect_list()"""
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        key = tuple(patterns)
+        if key not in self.compiledpatterns:
+            compiled = []
+            for pattern in patterns:
+                if pattern is pexpect.EOF or pattern is pexpect.TIMEOUT:
+                    compiled.append(pattern)
+                else:
+                    # Same flags pexpect would use in expect()
+                    compiled.append(re.compile(pattern.encode('utf-8'),
+                        re.DOTALL))
+            self.compiledpatterns[key] = compiled
+        return self.compiledpatterns[key]
+
+
+    def expect(self, patterns, timeout=None):
+        """Wait for one of a list of patterns, using compiled patterns"""
+        if timeout is None:
+            timeout = self.timeout
+        return self.px.expect_list(self.compile_patterns(patterns),
+                timeout=timeout)
+
+
+    # Session steps (the *_steps methods) are coroutines shared by both
+    # engines. They only wait through wait_for(), pause() and close(),
+    # which block here, so run_steps() finishes them in one go; the async
+    # engine (asyncengine.py) overrides those three to await instead.
+
+    async def wait_for(self, patterns, timeout=None):
+        """Wait for one of a list of patterns (see expect)"""
+        return self.expect(patterns, timeout=timeout)
+
+
+    async def pause(self, seconds):
+        """Wait a number of seconds"""
+        sleep(seconds)
+
+
+    async def close(self):
+        """Close the session"""
+        self.px.close()
+
+
+    def interrupted(self):
+        """Hand the session to the user after a KeyboardInterrupt"""
+        # The lines weren't all run, so the device isn't done (for --resume)
+        self.status = 'interrupted'
+        self.end_phase()
+        print('==== KeyboardInterrupt ====' + \
+                '\n==== Interactive mode ====' + \
+                '\nPress enter for a prompt.')
+        self.px.logfile_read = None
+        self.px.interact()
+
+
+    async def failed(self, error):
+        """Record why the session stopped, close it, and return False"""
+        self.status = self.failure_status(error)
+        self.end_phase()
+        if isinstance(error, pexpect.exceptions.TIMEOUT):
+            # Move to next device on timeout
+            self.output('==== Timeout: Moving on ====')
+            await self.close()
+        elif isinstance(error, pexpect.EOF):
+            # Move to next device on disconnect
+            self.output('==== EOF: Disconnected ====')
+        else:
+            # Stop here, before anything else is sent (or committed)
+            self.failure = str(error)
+            self.output('==== Device error: Aborting ====')
+            await self.close()
+        return False
+
+
+    def send_line(self, line):
+        """Send a line and return the time it was sent"""
+        self.reads.mark()
+        sent = time()
+        self.px.sendline(line)
+        return sent
+
+
+    def command_done(self, line, sent, error=None, rejected=None):
+        """Record the result of a command and hand it to listeners"""
+        message = None
+        if error:
+            status = self.failure_status(error)
+            matched = None
+            if isinstance(error, DeviceError):
+                message = str(error)
+        else:
+            status = 'ok'
+            matched = time()
+            if rejected:
+                policy, message = rejected
+                if policy == 'skip':
+                    status = 'rejected'
+        self.commandcount += 1
+        record = {
+                'type': 'command',
+                'device': self.device,
+                'devicetype': self.name,
+                'command': line,
+                'commandclass': self.command_class(line),
+                'output': self.reads.location,
+                'status': status,
+                'bytes': self.reads.count,
+                'sent': sent,
+                'firstbyte': self.reads.firstbyte,
+                'matched': matched,
+                'error': message
+                }
+        self.reads.mark()
+        for listener in self.listeners:
+            listener.command_done(record)
+
+
+    def start_phase(self, phase):
+        """Finish timing the current phase, and start timing another"""
+        self.end_phase()
+        self.phase = phase
+        self.phasestart = time()
+
+
+    def end_phase(self):
+        """Hand the current phase's duration to listeners"""
+        if not self.phase:
+            return
+        if self.status not in (None, 'ok'):
+            self.failedphase = self.phase
+        record = {
+                'type': 'phase',
+                'device': self.device,
+                'devicetype': self.name,
+                'phase': self.phase,
+                'status': self.status,
+                'seconds': time() - self.phasestart
+                }
+        self.phase = None
+        for listener in self.listeners:
+            listener.phase_done(record)
+
+
+    def prompt_patterns(self, patterns):
+        """Return error patterns plus prompt patterns, and the error count"""
+        if not isinstance(patterns, list):
+            patterns = [patterns]
+        errors = self.errorpatterns.get(self.errormode, [])
+        return [x[0] for x in errors] + patterns, len(errors)
+
+
+    def line_error(self, index):
+        """Apply an error pattern's policy; return (policy, message)"""
+        pattern, policy = self.errorpatterns[self.errormode][index]
+        message = self.px.after.decode('utf-8', 'replace').strip()
+        if policy == 'abort':
+            raise DeviceError(message)
+        self.output('==== Device error (' + policy + '): ' + message + \
+                ' ====')
+        return policy, message
+
+
+    def expect_prompt(self, patterns, timeout=None):
+        """Wait for a prompt, applying any error patterns matched first"""
+        return run_steps(self.prompt_steps(patterns, timeout=timeout))
+
+
+    async def prompt_steps(self, patterns, timeout=None):
+        """Wait for a prompt, applying any error patterns matched first"""
+        # Returns the prompt's index in patterns, and the (policy, message)
+        # of an error that came before it, if any
+        combined, count = self.prompt_patterns(patterns)
+        index = await self.wait_for(combined, timeout=timeout)
+        if index >= count:
+            return index - count, None
+        rejected = self.line_error(index)
+        return await self.wait_for(patterns, timeout=timeout), rejected
+
+
+    def failure_status(self, error):
+        """Return the result status for a session exception"""
+        if isinstance(error, pexpect.exceptions.TIMEOUT):
+            return 'timeout'
+        elif isinstance(error, pexpect.EOF):
+            return 'eof'
+        else:
+            return 'error'
+
+
+    def failure_class(self):
+        """Return the session's failure class for retries (see scheduler.py)"""
+        if self.status in (None, 'ok', 'interrupted', 'expired'):
+            # The user stopped an interrupted device, and an expired one
+            # has rolled back; don't retry them
+            return None
+        if self.status == 'error' and self.failure and \
+                self.failedphase not in (None, 'spawn', 'auth', 'paging'):
+            # Rejected by an error pattern; the same lines will fail again
+            return 'device'
+        if self.failedphase in (None, 'spawn', 'auth', 'paging'):
+            if self.status == 'error':
+                # Refused connections are worth retrying; bad credentials
+                # and unknown hosts are not
+                for failure in self.transientfailures:
+                    if re.search(failure, self.failure):
+                        return 'connect'
+                return 'auth'
+            return 'connect'
+        elif self.errormode == 'exec':
+            # Any phase of execute(), including the exit at the end
+            return 'exec'
+        else:
+            return 'config'
+
+
+    def command_class(self, line):
+        """Return the class a command's round trip times are kept under"""
+        words = line.split()
+        if not words:
+            return 'enter'
+        return words[0].lower()
+
 
-    def configure(self, commands=None, commit=False):
+    def line_timeout(self, commandclass):
+        """Return the timeout for a command class (learned, if we can)"""
+        if self.timeouts:
+            return self.timeouts.timeout(self.device, commandclass,
+                    self.timeout)
+        return self.timeout
+
+
+    def run_line(self, line, patterns):
+        """Send a line and wait for one of the given prompt patterns"""
+        return run_steps(self.line_steps(line, patterns))
+
+
+    async def line_steps(self, line, patterns):
+        """Send a line and wait for one of the given prompt patterns"""
+        sent = self.send_line(line)
+        try:
+            index, rejected = await self.prompt_steps(patterns,
+                    timeout=self.line_timeout(self.command_class(line)))
+        except(pexpect.exceptions.TIMEOUT, pexpect.EOF, DeviceError) as error:
+            self.command_done(line, sent, error)
+            raise
+        self.command_done(line, sent, rejected=rejected)
+        self.pacer.observe(line, self.px.before, self.px.buffer)
+        if self.pacer.delay:
+            await self.pause(self.pacer.delay)
+        return index
+
+
+    def run_lines(self, lines, patterns):
+        """Send lines, a window at a time, and match a prompt for each"""
+        return run_steps(self.lines_steps(lines, patterns))
+
+
+    async def lines_steps(self, lines, patterns):
+        """Send lines, a window at a time, and match a prompt for each"""
+        if self.window <= 1:
+            for line in lines:
+                await self.line_steps(line, patterns)
+            return
+        window = netexec.pacing.PipelineWindow(self.window)
+        position = 0
+        while position < len(lines):
+            batch = lines[position:position + window.size]
+            start = time()
+            sent = []
+            for line in batch:
+                sent.append(self.send_line(line))
+            # Prompts come back in the order lines were sent, so the nth
+            # prompt closes the output of the nth line in the batch.
+            clean = True
+            for line, linesent in zip(batch, sent):
+                try:
+                    index, rejected = await self.prompt_steps(patterns,
+                            timeout=self.line_timeout(
+                                self.command_class(line)))
+                except(pexpect.exceptions.TIMEOUT, pexpect.EOF,
+                        DeviceError) as error:
+                    self.command_done(line, linesent, error)
+                    raise
+                self.command_done(line, linesent, rejected=rejected)
+                if line.encode('utf-8') not in self.px.before:
+                    clean = False
+            window.observe(time() - start, len(batch), clean)
+            position += len(batch)
+
+
+    def bulkload(self, commands, loadtype):
+        """Stream lines to the device in one bulk config load"""
+        return run_steps(self.bulkload_steps(commands, loadtype))
+
+
+    async def bulkload_steps(self, commands, loadtype):
+        """Stream lines to the device in one bulk config load"""
+        command = self.bulkloadcommands[loadtype]
+        sent = self.send_line(command)
+        try:
+            if self.bulkloadready:
+                await self.wait_for(self.bulkloadready)
+            text = '\n'.join(commands) + '\n'
+            for position in range(0, len(text), self.bulkchunksize):
+                self.px.send(text[position:position + self.bulkchunksize])
+                # Read whatever has been echoed so far, so the device never
+                # blocks on output while we are still writing.
+                await self.wait_for(pexpect.TIMEOUT, timeout=0)
+            self.px.send(self.bulkloadend)
+            index, rejected = await self.prompt_steps(self.prompts['config'])
+        except(pexpect.exceptions.TIMEOUT, pexpect.EOF, DeviceError) as error:
+            self.command_done(command, sent, error)
+            raise
+        self.command_done(command, sent, rejected=rejected)
+
+
+    def disconnect(self):
+        """Run exit commands and close the session"""
+        return run_steps(self.disconnect_steps())
+
+
+    async def disconnect_steps(self):
+        """Run exit commands and close the session"""
+        for line in self.exitcommands:
+            await self.line_steps(line, self.promptoptions + [pexpect.EOF])
+        await self.close()
+
+
+    def configure(self, commands=None, commit=False, bulk=None,
+            confirmed=None, confirming=False):
         """Enter lines in config mode"""
         # This method should enter config mode, run preconfig, enter lines,
         # and run postconfig. If the device type has the ability to
         # commit changes, they should not be committed.
+        return run_steps(self.configure_steps(commands=commands,
+            commit=commit, bulk=bulk, confirmed=confirmed,
+            confirming=confirming))
+
+
+    async def configure_steps(self, commands=None, commit=False, bulk=None,
+            confirmed=None, confirming=False):
+        """Enter lines in config mode"""
         try:
+            if confirming and self.confirmpendingcommand and \
+                    not await self.pending_steps():
+                return False
+            self.start_phase('config')
+            self.errormode = 'config'
             if self.configcommand:
-                self.px.sendline(self.configcommand)
-                self.px.expect(self.prompts['config'], timeout=self.timeout)
-                print(self.px.before.decode('utf-8'))
-                sleep(0.8)
+                await self.line_steps(self.configcommand,
+                        self.prompts['config'])
             if self.preconfigcommands:
                 for line in self.preconfigcommands:
-                    self.px.sendline(line)
-                    self.px.expect(self.prompts['config'], timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
-            if commands:
-                for line in commands:
-                    self.px.sendline(line)
-                    self.px.expect(self.prompts['config'], timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
+                    await self.line_steps(line, self.prompts['config'])
+            if commands and bulk and self.bulkloadcommands:
+                await self.bulkload_steps(commands, bulk)
+            elif commands:
+                await self.lines_steps(commands, self.prompts['config'])
             if self.postconfigcommands:
+                self.start_phase('compare')
                 for line in self.postconfigcommands:
-                    self.px.sendline(line)
-                    self.px.expect(self.prompts['config'], timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
+                    await self.line_steps(line, self.prompts['config'])
             if commit:
-                # Commit config
-                if self.commitcommand:
-                    self.px.sendline(self.commitcommand)
-                    self.px.expect(self.promptoptions, timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
+                # Commit config (to be confirmed within some minutes, or
+                # rolled back, if confirmed is set)
+                self.start_phase('commit')
+                if confirmed:
+                    if not self.commitconfirmedcommand:
+                        raise DeviceError(self.name + \
+                                ' has no commit confirmed')
+                    # The rollback timer starts about now
+                    self.committime = time()
+                    await self.line_steps(self.commitconfirmedcommand.format(
+                        confirmed), self.promptoptions)
+                elif self.commitcommand:
+                    await self.line_steps(self.commitcommand,
+                            self.promptoptions)
                 # Exit config mode, if needed
                 if self.configquitcommand:
-                    self.px.sendline(self.configquitcommand)
-                    self.px.expect(self.promptoptions, timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
+                    await self.line_steps(self.configquitcommand,
+                            self.promptoptions)
                 # Disconnect from the device
-                for line in self.exitcommands:
-                    self.px.sendline(line)
-                    self.px.expect(self.promptoptions, timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
+                self.start_phase('disconnect')
+                await self.disconnect_steps()
+                self.end_phase()
             else:
-                print('\n==== Interactive mode ====' + \
-                        '\nPress enter for a prompt.')
-                self.px.interact()
+                # Uncommitted changes are discarded if the session is closed
+                self.end_phase()
+                if self.interactive:
+                    self.go_interactive()
+                else:
+                    await self.close()
+            return True
 
         except(KeyboardInterrupt):
             # If user hits ctrl-c, go interactive.
-            print('==== KeyboardInterrupt ====' + \
-                    '\n==== Interactive mode ====' + \
-                    '\nPress enter for a prompt.')
-            self.px.interact()
-        except(pexpect.exceptions.TIMEOUT):
-            # Move to next device on timeout
-            print('==== Timeout: Moving on ====')
-            return()
-        except(pexpect.EOF):
-            # Move to next device on disconnect
-            try:
-                print(self.px.before.decode('utf-8'))
-            except(Exception):
-                pass
-            print('==== EOF: Disconnected ====')
-            return()
+            self.interrupted()
+            return True
+        except(pexpect.exceptions.TIMEOUT, pexpect.EOF, DeviceError) as error:
+            return await self.failed(error)
+
+
+    async def pending_steps(self):
+        """Check that a commit confirmed is pending; disconnect if not"""
+        self.start_phase('check')
+        self.errormode = 'exec'
+        await self.line_steps(self.confirmpendingcommand, self.promptoptions)
+        if re.search(self.confirmpendingrex.encode('utf-8'), self.px.before):
+            return True
+        # The device rolled back already; confirming would commit nothing
+        self.status = 'expired'
+        self.failure = 'no commit confirmed pending on the device'
+        self.end_phase()
+        self.output('==== No commit confirmed pending: not confirming ====')
+        await self.disconnect_steps()
+        return False
 
 
     def execute(self, commands=None):
         """Just enter all the lines"""
         # This method should just enter lines, and accept any of the
         # available prompts.
+        return run_steps(self.execute_steps(commands=commands))
+
+
+    async def execute_steps(self, commands=None):
+        """Just enter all the lines"""
         try:
+            self.start_phase('exec')
+            self.errormode = 'exec'
             if commands:
                 for line in commands:
-                    self.px.sendline(line)
-                    self.px.expect(self.promptoptions, timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
-            print('\n==== Interactive mode ====' + \
-                    '\nPress enter for a prompt.')
-            self.px.interact()
+                    await self.line_steps(line, self.promptoptions)
+            if self.interactive:
+                self.end_phase()
+                self.go_interactive()
+            else:
+                self.start_phase('disconnect')
+                await self.disconnect_steps()
+                self.end_phase()
+            return True
 
         except(KeyboardInterrupt):
             # If user hits ctrl-c, go interactive.
-            print('==== KeyboardInterrupt ====' + \
-                    '\n==== Interactive mode ====' + \
-                    '\nPress enter for a prompt.')
-            self.px.interact()
-        except(pexpect.exceptions.TIMEOUT):
-            # Move to next device on timeout
-            print('==== Timeout: Moving on ====')
-            return()
-        except(pexpect.EOF):
-            # Move to next device on disconnect
-            print('==== EOF: Disconnected ====')
-            return()
+            self.interrupted()
+            return True
+        except(pexpect.exceptions.TIMEOUT, pexpect.EOF, DeviceError) as error:
+            return await self.failed(error)
+
+
+    def spawn(self, device, command='ssh'):
+        """Start the connection command for a device"""
+        myenv = environ.copy()
+        # Run the command directly (no shell), with an explicit argv
+        if self.replay:
+            argv = netexec.replay.replay_command(self.replay,
+                    self.replayspeed)
+        else:
+            argv = shlex.split(command)
+            if self.port:
+                argv.extend([self.portoption, str(self.port)])
+        if self.user:
+            argv.append(self.user + '@' + device)
+        else:
+            argv.append(device)
+        if self.sink is None:
+            self.sink = netexec.sinks.StreamSink()
+        self.reads = netexec.sinks.CountingSink(self.sink)
+        self.px = pexpect.spawn(argv[0], args=argv[1:], env=myenv,
+                    timeout=self.timeout,
+                    searchwindowsize=self.searchwindowsize)
+        # Stream output to the sink as it's read, and only keep the tail
+        # of it in memory for matching
+        self.px.logfile_read = self.reads
+        self.px.buffer_type = TailBuffer
+        # pexpect waits before every send by default; login replies wait
+        # logindelay instead, and pacing decides after that
+        self.px.delaybeforesend = None
+        if self.record:
+            self.capture = netexec.replay.Capture(self.record,
+                    redact=[self.password])
+            self.px.logfile_read = self.capture.reads(self.reads)
+            self.px.logfile_send = self.capture.sends()
+
+
+    def learn_prompt(self, prompt):
+        """Anchor the exec and config prompts to the prompt seen at login"""
+        if not self.promptlearnrex:
+            return
+        match = re.search(self.promptlearnrex,
+                prompt.decode('utf-8', 'replace'))
+        if not match:
+            return
+        base = re.escape(match.group('base'))
+        prompts = dict(self.prompts)
+        for mode in self.learnedprompts:
+            prompts[mode] = self.learnedprompts[mode].format(base)
+        self.prompts = prompts
+        self.promptoptions = list(self.prompts.values())
+        # Learned patterns are only good for this session; keep them out
+        # of the shared cache.
+        self.compiledpatterns = {}
+
+
+    def login_patterns(self):
+        """Return every pattern that can show up while logging in"""
+        # Order matters to login_step: host key, username, password,
+        # failures, then CLI prompts.
+        return [self.hostkeyrex, self.usernamerex, self.passwordrex] + \
+                self.loginfailures + self.promptoptions
 
 
-    def connect(self, device=None, user=None, password=None, timeout=45,
+    def login_step(self, index, sendyes=False):
+        """Return a reply to a login pattern, True if done, False if failed"""
+        failures = 3 + len(self.loginfailures)
+        if index == 0:
+            if sendyes and not self.loginstate.get('yes'):
+                self.loginstate['yes'] = True
+                return 'yes'
+            self.failure = 'host key not verified (-y sends "yes")'
+            return False
+        elif index == 1:
+            if self.user and not self.loginstate.get('user'):
+                self.loginstate['user'] = True
+                return self.user
+            self.failure = 'username required or rejected'
+            return False
+        elif index == 2:
+            if self.password and not self.loginstate.get('password'):
+                self.loginstate['password'] = True
+                return self.password
+            self.failure = 'password required or rejected (-p)'
+            return False
+        elif index < failures:
+            self.failure = self.px.after.decode('utf-8', 'replace')
+            return False
+        else:
+            return True
+
+
+    def connect(self, device=None, user=None, password=None, timeout=None,
             command='ssh', sendyes=False):
         """Initiate a connection"""
+        return run_steps(self.connect_steps(device=device, user=user,
+            password=password, timeout=timeout, command=command,
+            sendyes=sendyes))
+
+
+    async def connect_steps(self, device=None, user=None, password=None,
+            timeout=None, command='ssh', sendyes=False):
+        """Initiate a connection"""
+        if user:
+            self.user = user
+        if password:
+            self.password = password
+        if timeout:
+            self.timeout = timeout
+        self.pacer = netexec.pacing.new_pacing(self.pacing, self.pacingdelay)
+        self.device = device
+        self.status = 'ok'
         # Connect to the device
         try:
-            myenv = environ.copy()
-            if self.user:
-                # Set up connection command
-                commandline = 'bash -ic "' + command + ' ' + \
-                        self.args.user + '@' + device + '"'
-            else:
-                commandline = 'bash -ic "' + command + ' ' + \
-                        device + '"'
-            self.px = pexpect.spawn(commandline, env=myenv,
-                        timeout=self.timeout)
-            # Send 'yes' to verify host key, if option is enabled
-            if sendyes:
-                sleep(5)
-                verifymsg = 'Are you sure you want to continue ' + \
-                        'connecting (yes/no)?'
-                if self.px.before:
-                    if verifymsg in self.px.before.decode('utf-8'):
-                        self.px.sendline('yes')
-            
-            if self.password:
-                self.px.expect(self.passwordrex, timeout=self.timeout)
-                print(self.px.before.decode('utf-8'))
-                self.px.sendline(self.password)
-            self.px.expect(self.promptoptions, timeout=self.timeout)
-            print(self.px.before.decode('utf-8'))
-            sleep(0.8)
+            self.start_phase('spawn')
+            self.spawn(device, command=command)
+            # Answer whatever login prompt shows up first
+            self.start_phase('auth')
+            patterns = self.login_patterns()
+            self.loginstate = {}
+            reply = None
+            while reply is not True:
+                index = await self.wait_for(patterns,
+                        timeout=self.line_timeout('login'))
+                reply = self.login_step(index, sendyes=sendyes)
+                if reply is False:
+                    self.status = 'error'
+                    self.end_phase()
+                    self.output('==== Login failed: ' + self.failure + \
+                            ' ====')
+                    await self.close()
+                    return False
+                elif reply is not True:
+                    # Give the device time to turn echo off (for passwords)
+                    await self.pause(self.logindelay)
+                    self.px.sendline(reply)
+            self.learn_prompt(self.px.after)
+            if self.pacer.delay:
+                await self.pause(self.pacer.delay)
 
             # Disable screen paging and stuff
             if self.disablepaging:
+                self.start_phase('paging')
                 for line in self.disablepaging:
-                    self.px.sendline(line)
-                    self.px.expect(self.promptoptions, timeout=self.timeout)
-                    print(self.px.before.decode('utf-8'))
-                    sleep(0.8)
+                    await self.line_steps(line, self.promptoptions)
+            self.end_phase()
+            return True
 
         except(KeyboardInterrupt):
             # If user hits ctrl-c, go interactive.
-            print('==== KeyboardInterrupt ====' + \
-                    '\n==== Interactive mode ====' + \
-                    '\nPress enter for a prompt.')
-            self.px.interact()
-        except(pexpect.exceptions.TIMEOUT):
-            # Move to next device on timeout
-            print('==== Timeout: Moving on ====')
-            return()
-        except(pexpect.EOF):
-            # Move to next device on disconnect
-            print('==== EOF: Disconnected ====')
-            return()
-
+            self.interrupted()
+            return False
+        except(pexpect.exceptions.TIMEOUT, pexpect.EOF) as error:
+            return await self.failed(error)
+        except(pexpect.ExceptionPexpect) as error:
+            # The connect command itself failed (not found, for example)
+            self.status = 'error'
+            self.failure = str(error)
+            self.end_phase()
+            self.output('==== Connect failed: ' + self.failure + ' ====')
+            return False
@@ -0,0 +1,150 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Device lists are read lazily, one line at a time, so a large inventory
+# never sits in memory as a list. Blank lines and '#' comments are
+# skipped, and repeated devices are dropped. Sharding splits a list into
+# disjoint slices with a stable hash, so several hosts given the same
+# file and different --shard values take no device twice.
+#
+# Each device is an entry dict with a 'device' key. Plain lists give
+# nothing else; CSV and YAML inventories can also set any of these per
+# device, and any other columns are kept as extra attributes:
+#
+#   devicetype  device type module (instead of -d)
+#   user        username (instead of -u)
+#   port        port for the connect command
+#   command     command to connect (instead of -c)
+
+from hashlib import blake2b
+import csv
+
+
+def device_hash(device):
+    """Return a stable 64-bit hash of a device name"""
+    return int.from_bytes(blake2b(device.encode('utf-8'),
+        digest_size=8).digest(), 'big')
+
+
+def parse_shard(shard):
+    """Return (index, count) from an 'i/N' shard string (i from 1 to N)"""
+    try:
+        index, count = [int(x) for x in shard.split('/')]
+    except ValueError:
+        raise ValueError('Shard must look like i/N: ' + shard)
+    if count < 1 or index < 1 or index > count:
+        raise ValueError('Shard must be between 1/N and N/N: ' + shard)
+    return index, count
+
+
+def new_entry(attributes):
+    """Return an entry dict with stripped values, or None to skip it"""
+    entry = {}
+    for key, value in attributes.items():
+        if key is None or value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            entry[str(key).strip().lower()] = value
+    device = entry.get('device', '')
+    if not device or device.startswith('#'):
+        return None
+    return entry
+
+
+def read_devices(path):
+    """Yield entries from a plain device list file"""
+    with open(path, 'r') as f:
+        for line in f:
+            entry = new_entry({'device': line})
+            if entry:
+                yield entry
+
+
+def read_csv(f):
+    """Yield entries from an open CSV inventory"""
+    with f:
+        for row in csv.DictReader(f):
+            entry = new_entry(row)
+            if entry:
+                yield entry
+
+
+def read_yaml(path):
+    """Return entries from a YAML inventory"""
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError('PyYAML is needed to read YAML inventories: ' + \
+                path)
+    with open(path, 'r') as f:
+        inventory = yaml.safe_load(f) or []
+    # Either a list of mappings with a device key, or a mapping of
+    # device: attributes
+    if isinstance(inventory, dict):
+        inventory = [dict(attributes or {}, device=device)
+                for device, attributes in inventory.items()]
+    entries = []
+    for attributes in inventory:
+        if not isinstance(attributes, dict):
+            attributes = {'device': attributes}
+        entry = new_entry(attributes)
+        if entry:
+            entries.append(entry)
+    return entries
+
+
+def read_inventory(path):
+    """Return an iterator of entries from a device list or inventory"""
+    # Problems with the file itself are raised here (as ValueError),
+    # before any device is run
+    if path.endswith('.csv'):
+        f = open(path, 'r', newline='')
+        fields = csv.DictReader(f).fieldnames or []
+        if 'device' not in [x.strip().lower() for x in fields]:
+            f.close()
+            raise ValueError('CSV inventory has no device column: ' + path)
+        f.seek(0)
+        return read_csv(f)
+    elif path.endswith(('.yaml', '.yml')):
+        return iter(read_yaml(path))
+    else:
+        return read_devices(path)
+
+
+def unique(entries):
+    """Yield entries, dropping repeated devices"""
+    # Keep hashes instead of names; 64 bits each, with collisions too
+    # rare to matter for any real fleet
+    seen = set()
+    for entry in entries:
+        key = device_hash(entry['device'])
+        if key not in seen:
+            seen.add(key)
+            yield entry
+
+
+def shard(entries, index, count):
+    """Yield only the entries in shard index (from 1) of count"""
+    for entry in entries:
+        if device_hash(entry['device']) % count == index - 1:
+            yield entry
@@ -0,0 +1,116 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The journal is an append-only JSONL file with one line per finished
+# device, fsync'd as it's written, so it survives the run being killed.
+# Each line carries a hash of the input (command lines and mode). With
+# --resume, devices whose last journal line is 'ok' for the same input
+# are skipped, and everything else runs again.
+
+from hashlib import sha256
+from threading import Lock
+from time import time
+import json
+import os
+import netexec.inventory
+import netexec.results
+
+
+def input_hash(lines, mode):
+    """Return a hash of the command lines and the mode they run in"""
+    return sha256(json.dumps([mode, lines]).encode('utf-8')).hexdigest()[:16]
+
+
+def read_done(path, inputhash):
+    """Return a set of hashes of devices finished ok with this input"""
+    done = set()
+    if not os.path.isfile(path):
+        return done
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short when a run was killed
+                continue
+            if record.get('input') != inputhash:
+                continue
+            key = netexec.inventory.device_hash(record['device'])
+            # The last line for a device wins
+            if record.get('status') == 'ok':
+                done.add(key)
+            else:
+                done.discard(key)
+    return done
+
+
+class Journal(netexec.results.Listener):
+
+    def __init__(self, path, inputhash, resume=False):
+        """Initialize a listener that journals finished devices"""
+        self.inputhash = inputhash
+        self.done = read_done(path, inputhash) if resume else set()
+        self.skipped = 0
+        self.resume = resume
+        self.file = open(path, 'a')
+        # Start on a fresh line if the last run was cut off mid-line
+        if self.file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self.file.write('\n')
+        self.lock = Lock()
+
+
+    def pending(self, entries):
+        """Yield entries not already finished ok with this input"""
+        for entry in entries:
+            if netexec.inventory.device_hash(entry['device']) in self.done:
+                self.skipped += 1
+            else:
+                yield entry
+
+
+    def device_done(self, record):
+        """Take the record for a finished device"""
+        # With --commit-confirmed, a device is only done once confirmed
+        if record.get('commitphase') == 'confirmed' and \
+                record['status'] == 'ok':
+            return
+        line = json.dumps({
+            'device': record['device'],
+            'status': record['status'],
+            'input': self.inputhash,
+            'end': record.get('end', time())
+            }) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+
+    def close(self):
+        """Close the journal file"""
+        self.file.close()
+        if self.resume:
+            print('==== Resumed: skipped ' + str(self.skipped) + \
+                    ' device(s) already done ====')
@@ -0,0 +1,109 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Pacing decides how long to wait after a prompt before the next line is
+# sent. The prompt match is what releases a line; pacing only adds a
+# guard delay for devices that can't keep up with input.
+
+pacingtypes = ['none', 'fixed', 'adaptive']
+
+
+class Pacing:
+
+    def __init__(self, delay=0.8):
+        """Initialize a pacing policy that never waits"""
+        self.maxdelay = delay
+        self.delay = 0
+
+
+    def observe(self, line, before, leftover):
+        """Learn from a line's echo and what followed its prompt"""
+        pass
+
+
+class FixedPacing(Pacing):
+
+    def __init__(self, delay=0.8):
+        """Initialize a pacing policy that always waits the same time"""
+        Pacing.__init__(self, delay)
+        self.delay = delay
+
+
+class AdaptivePacing(Pacing):
+
+    def __init__(self, delay=0.8):
+        """Initialize a pacing policy that learns a delay per device"""
+        # Start with no delay, back off (up to the device type's delay)
+        # when the device mangles our echo or keeps talking after its
+        # prompt, and decay back toward zero while things look clean.
+        Pacing.__init__(self, delay)
+        self.step = 0.05
+        self.decay = 0.5
+
+
+    def observe(self, line, before, leftover):
+        """Learn from a line's echo and what followed its prompt"""
+        if line and before is not None:
+            echoed = line.encode('utf-8') in before
+        else:
+            echoed = True
+        if not echoed or leftover:
+            self.delay = min(self.maxdelay, max(self.step, self.delay * 2))
+        else:
+            self.delay = self.delay * self.decay
+            if self.delay < self.step / 4:
+                self.delay = 0
+
+
+def new_pacing(pacing='adaptive', delay=0.8):
+    """Return a pacing policy object by name"""
+    if pacing == 'none':
+        return Pacing(delay)
+    elif pacing == 'fixed':
+        return FixedPacing(delay)
+    elif pacing == 'adaptive':
+        return AdaptivePacing(delay)
+    else:
+        raise ValueError('Unknown pacing type: ' + str(pacing))
+
+
+class PipelineWindow:
+
+    def __init__(self, size=1):
+        """Initialize a window of lines to send before matching prompts"""
+        # Additive increase, multiplicative decrease: grow by one line
+        # after a clean window, halve when the device falls behind.
+        self.maxsize = max(1, size)
+        self.size = self.maxsize
+        self.bestlinetime = None
+
+
+    def observe(self, seconds, count, clean=True):
+        """Resize the window after a batch of count lines took seconds"""
+        linetime = seconds / max(1, count)
+        if self.bestlinetime is None or linetime < self.bestlinetime:
+            self.bestlinetime = linetime
+        slow = linetime > self.bestlinetime * 2 and count == self.size
+        if not clean or slow:
+            self.size = max(1, self.size // 2)
+        elif self.size < self.maxsize:
+            self.size += 1
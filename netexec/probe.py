@@ -0,0 +1,111 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# The pre-flight probe opens a TCP connection to each device's port
+# before any session is spawned, so a device that is down costs a short
+# probe timeout instead of the full session timeout. Probing runs in its
+# own thread with its own event loop, a chunk of devices at a time, and
+# stays a bounded distance ahead of the engine that takes the results.
+# Taking results never blocks, so the async engine's event loop doesn't
+# stall while a chunk is probed.
+
+from queue import Empty, Queue
+from threading import Thread
+import asyncio
+import socket
+
+
+class Prober:
+
+    def __init__(self, port=22, timeout=3.0, chunksize=256):
+        """Initialize a TCP reachability probe"""
+        self.port = port
+        self.timeout = timeout
+        self.chunksize = chunksize # devices probed at once
+
+
+    async def probe_one(self, entry):
+        """Return None if a device's port accepts a connection, or why not"""
+        try:
+            reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(entry['device'],
+                        int(entry.get('port', self.port))),
+                    self.timeout)
+            writer.close()
+            return None
+        except asyncio.TimeoutError:
+            return 'probe timed out'
+        except socket.gaierror as err:
+            return 'could not resolve hostname: ' + str(err)
+        except (OSError, ValueError) as err:
+            return 'probe failed: ' + str(err)
+
+
+    async def probe_chunk(self, chunk):
+        """Return probe results for a chunk of devices, in order"""
+        return await asyncio.gather(*[self.probe_one(x) for x in chunk])
+
+
+    def run(self, entries, results):
+        """Probe devices a chunk at a time, putting (entry, error) results"""
+        try:
+            chunk = []
+            for entry in entries:
+                chunk.append(entry)
+                if len(chunk) >= self.chunksize:
+                    for result in zip(chunk, asyncio.run(
+                            self.probe_chunk(chunk))):
+                        results.put(result)
+                    chunk = []
+            if chunk:
+                for result in zip(chunk, asyncio.run(
+                        self.probe_chunk(chunk))):
+                    results.put(result)
+        except Exception as err:
+            results.put((None, err))
+        results.put(None)
+
+
+    def reachable(self, entries, unreachable):
+        """Yield devices that pass the probe, or None while none is ready"""
+        # Devices that fail go to unreachable(entry, error), called from
+        # the consuming thread
+        # At most two chunks are waiting, so results are never stale
+        results = Queue(maxsize=self.chunksize * 2)
+        thread = Thread(target=self.run, args=(entries, results),
+                daemon=True)
+        thread.start()
+        while True:
+            try:
+                result = results.get_nowait()
+            except Empty:
+                yield None
+                continue
+            if result is None:
+                break
+            entry, error = result
+            if entry is None:
+                raise error
+            elif error:
+                unreachable(entry, error)
+            else:
+                yield entry
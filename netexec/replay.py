@@ -0,0 +1,177 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Session capture and replay. A capture is a JSONL file of timed events:
+# bytes read from the device, and bytes sent to it (passwords blanked out).
+# Replaying runs this module as the connect command, under the same pty a
+# real ssh session would get:
+#
+#   python3 netexec/replay.py [-s SPEED] CAPTURE
+#
+# It plays read events back (at SPEED times the original pace; 0 for as
+# fast as possible) and waits for our input wherever a send was captured.
+# Sends are matched by line, so a replay can be given another password or
+# other lines than the capture, as long as it sends as many of them.
+
+from argparse import ArgumentParser
+from base64 import b64decode, b64encode
+from threading import Lock
+from time import sleep, time
+import json
+import os
+import sys
+import tty
+
+
+class Capture:
+
+    def __init__(self, path, redact=None):
+        """Initialize a capture file for one session"""
+        self.file = open(path, 'w')
+        self.start = time()
+        self.redact = [x.encode('utf-8') for x in redact or [] if x]
+        self.lock = Lock()
+
+
+    def event(self, direction, data):
+        """Write one timed event to the capture"""
+        if direction == 'send' and data.rstrip(b'\r\n') in self.redact:
+            # Keep the line ending; replay matches sends by line
+            data = b'*' * len(data.rstrip(b'\r\n')) + \
+                    data[len(data.rstrip(b'\r\n')):]
+        record = {'t': round(time() - self.start, 6), 'dir': direction,
+                'data': b64encode(data).decode('ascii')}
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+
+
+    def reads(self, sink):
+        """Return a stream for px.logfile_read that also feeds a sink"""
+        return CaptureStream(self, 'read', sink)
+
+
+    def sends(self):
+        """Return a stream for px.logfile_send"""
+        return CaptureStream(self, 'send')
+
+
+    def close(self):
+        """Close the capture file"""
+        self.file.close()
+
+
+class CaptureStream:
+
+    def __init__(self, capture, direction, sink=None):
+        """Initialize one direction of a capture"""
+        self.capture = capture
+        self.direction = direction
+        self.sink = sink
+
+
+    def write(self, data):
+        """Capture bytes, and pass them on"""
+        self.capture.event(self.direction, data)
+        if self.sink:
+            self.sink.write(data)
+
+
+    def flush(self):
+        """Flush the capture and whatever is downstream"""
+        self.capture.file.flush()
+        if self.sink:
+            self.sink.flush()
+
+
+def read_events(path):
+    """Yield (seconds, direction, bytes) for each event in a capture"""
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record['t'], record['dir'], b64decode(record['data'])
+
+
+def replay_command(path, speed=1.0):
+    """Return the argv that replays a capture as a connect command"""
+    return [sys.executable, os.path.abspath(__file__), '-s', str(speed),
+            path]
+
+
+def read_send(data, buffered):
+    """Read our input for a captured send; return leftover input, or None"""
+    # Wait for as many line endings as the send had; a piece with no line
+    # ending (ctrl-d, a bulk load chunk) is matched by length
+    lines = data.count(b'\n')
+    tail = len(data) - data.rfind(b'\n') - 1
+    while True:
+        if lines:
+            found = -1
+            for count in range(lines):
+                found = buffered.find(b'\n', found + 1)
+                if found < 0:
+                    break
+            if found >= 0 and len(buffered) - found - 1 >= tail:
+                return buffered[found + 1 + tail:]
+        elif len(buffered) >= tail:
+            return buffered[tail:]
+        incoming = os.read(0, 4096)
+        if not incoming:
+            return None
+        buffered += incoming
+
+
+def replay(path, speed=1.0):
+    """Play a capture back over stdin and stdout"""
+    # Raw mode: captured reads already hold the device's echo and line
+    # endings, and sends must be read back byte for byte.
+    if os.isatty(0):
+        tty.setraw(0)
+    last = 0
+    buffered = b''
+    for seconds, direction, data in read_events(path):
+        if direction == 'send':
+            buffered = read_send(data, buffered)
+            if buffered is None:
+                return
+        else:
+            if speed > 0 and seconds > last:
+                sleep((seconds - last) / speed)
+            os.write(1, data)
+        last = seconds
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('capture', action = 'store',
+            help = 'capture file to play back')
+    parser.add_argument('-s',
+            action = 'store', dest = 'speed', type = float, default = 1.0,
+            help = 'speed factor (default 1.0; 0 for no delays)')
+    parser.add_argument('target', action = 'store', nargs = '?',
+            help = 'ignored ([user@]device, as ssh would get it)')
+    args = parser.parse_args()
+    replay(args.capture, args.speed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Result records are plain dicts. Sessions hand them to their listeners
+# as each command, phase (spawn, auth, paging, config, compare, commit,
+# exec, disconnect) and device finishes. Subclass Listener to feed them
+# to other metrics systems.
+
+from threading import Lock
+import json
+
+
+class Listener:
+
+    def __init__(self):
+        """Initialize a result listener that ignores everything"""
+        pass
+
+
+    def command_done(self, record):
+        """Take the record for a finished command"""
+        pass
+
+
+    def phase_done(self, record):
+        """Take the record for a finished phase of a session"""
+        pass
+
+
+    def device_done(self, record):
+        """Take the record for a finished device"""
+        pass
+
+
+    def close(self):
+        """Finish taking records"""
+        pass
+
+
+class ResultWriter(Listener):
+
+    def __init__(self, path):
+        """Initialize a listener that appends records to a JSONL file"""
+        self.file = open(path, 'a')
+        self.lock = Lock()
+
+
+    def write(self, record):
+        """Write one record as a line of JSON"""
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+
+    def command_done(self, record):
+        """Take the record for a finished command"""
+        self.write(record)
+
+
+    def device_done(self, record):
+        """Take the record for a finished device"""
+        self.write(record)
+
+
+    def close(self):
+        """Close the results file"""
+        self.file.close()
+
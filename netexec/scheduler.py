@@ -0,0 +1,410 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Failed devices go back into the same pool as fresh ones. Each session
+# sorts its failure into a class (see DeviceTypeModule.failure_class):
+#
+#   auth     rejected credentials or host key; retrying can't help
+#   connect  the connection or login timed out, was refused, or dropped
+#   config   timeout or disconnect after config mode was entered; lines
+#            may be half applied, so this is only retried if asked for
+#   exec     timeout or disconnect in exec mode
+#   device   the device rejected a line (an 'abort' error pattern)
+#
+# A retry waits a random time up to base * 2^attempt (full jitter, capped)
+# so a flapping site is not hit by every retry at once. The queue never
+# blocks; engines take due retries ahead of fresh devices, and ask how
+# long to wait when nothing else is ready.
+#
+# Device sources never block either: one that has nothing ready yet (the
+# probe, see probe.py) yields None, and is asked again after pollwait.
+
+from itertools import chain
+from threading import Lock
+from time import sleep, time
+import heapq
+import random
+import netexec.results
+
+failureclasses = ['auth', 'connect', 'config', 'exec', 'device']
+pollwait = 0.05 # seconds between asking a source that wasn't ready
+end = object() # marks the end of a device source
+
+# Default retries per failure class
+retrylimits = {'auth': 0, 'connect': 2, 'config': 0, 'exec': 1, 'device': 0}
+
+
+def parse_limits(specs):
+    """Return retry limits from a list of 'class=count' strings"""
+    limits = dict(retrylimits)
+    for spec in specs or []:
+        try:
+            failclass, count = spec.split('=')
+            count = int(count)
+        except ValueError:
+            raise ValueError('Retry limits must look like class=count: ' + \
+                    spec)
+        if failclass not in failureclasses:
+            raise ValueError('Unknown failure class: ' + failclass + \
+                    ' (' + ', '.join(failureclasses) + ')')
+        limits[failclass] = count
+    return limits
+
+
+class RetryQueue:
+
+    def __init__(self, limits=None, base=2.0, cap=120.0):
+        """Initialize a queue of devices waiting to be retried"""
+        self.limits = limits or dict(retrylimits)
+        self.base = base
+        self.cap = cap
+        self.attempts = {} # device: failed attempts, while being retried
+        self.waiting = [] # heap of (due time, sequence, entry)
+        self.sequence = 0
+        self.lock = Lock()
+
+
+    def __len__(self):
+        """Return the number of devices waiting"""
+        return len(self.waiting)
+
+
+    def attempt(self, entry):
+        """Return which attempt at a device this is (from 1)"""
+        with self.lock:
+            return self.attempts.get(entry['device'], 0) + 1
+
+
+    def schedule(self, entry, failclass):
+        """Queue a failed device for retry; return the delay, or None"""
+        device = entry['device']
+        with self.lock:
+            failed = self.attempts.get(device, 0)
+            if not failclass or failed >= self.limits.get(failclass, 0):
+                self.attempts.pop(device, None)
+                return None
+            self.attempts[device] = failed + 1
+            delay = random.uniform(0, min(self.cap, self.base * 2 ** failed))
+            self.sequence += 1
+            heapq.heappush(self.waiting,
+                    (time() + delay, self.sequence, entry))
+            return delay
+
+
+    def pop_due(self):
+        """Return the next device due for retry, or None"""
+        with self.lock:
+            if self.waiting and self.waiting[0][0] <= time():
+                return heapq.heappop(self.waiting)[2]
+            return None
+
+
+    def wait_time(self):
+        """Return seconds until the next retry is due (None if none)"""
+        with self.lock:
+            if not self.waiting:
+                return None
+            return max(0, self.waiting[0][0] - time())
+
+
+# Shared infrastructure (TACACS servers, jump hosts) can be protected
+# two ways. A token bucket limits how many sessions start per second, and
+# group limits cap how many run at once per value of an inventory
+# attribute (site, jump host, devicetype). Both only answer whether a
+# device may start now, so any engine can use them without blocking.
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=None):
+        """Initialize a token bucket allowing rate starts per second"""
+        self.rate = rate
+        self.burst = burst or 1
+        self.tokens = self.burst
+        self.last = time()
+        self.lock = Lock()
+
+
+    def refill(self):
+        """Add the tokens earned since the last refill"""
+        now = time()
+        self.tokens = min(self.burst,
+                self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+
+    def take(self):
+        """Take a token if there is one; return True if taken"""
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+    def wait_time(self):
+        """Return seconds until a token is available"""
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class GroupLimit:
+
+    def __init__(self, attribute, limit, default=None):
+        """Initialize a cap on running devices per attribute value"""
+        self.attribute = attribute
+        self.limit = limit
+        self.default = default # value for devices without the attribute
+        self.running = {} # attribute value: running devices
+
+
+    def key(self, entry):
+        """Return a device's group, or None if it has none"""
+        return entry.get(self.attribute, self.default)
+
+
+    def full(self, entry):
+        """Return True if a device's group has no room"""
+        key = self.key(entry)
+        return key is not None and self.running.get(key, 0) >= self.limit
+
+
+    def acquire(self, entry):
+        """Count a device as running in its group"""
+        key = self.key(entry)
+        if key is not None:
+            self.running[key] = self.running.get(key, 0) + 1
+
+
+    def release(self, entry):
+        """Count a device as finished in its group"""
+        key = self.key(entry)
+        if key is not None:
+            self.running[key] -= 1
+            if not self.running[key]:
+                del self.running[key]
+
+
+def parse_group_limits(specs, defaults=None):
+    """Return group limits from a list of 'attribute=count' strings"""
+    defaults = defaults or {}
+    limits = []
+    for spec in specs or []:
+        try:
+            attribute, count = spec.split('=')
+            count = int(count)
+        except ValueError:
+            raise ValueError('Group limits must look like ' + \
+                    'attribute=count: ' + spec)
+        if count < 1:
+            raise ValueError('Group limits must be at least 1: ' + spec)
+        limits.append(GroupLimit(attribute, count,
+            default=defaults.get(attribute)))
+    return limits
+
+
+class WorkQueue:
+
+    def __init__(self, devices, retries, halted=None, bucket=None,
+            groups=None, maxheld=1000):
+        """Initialize a source of devices to run, retries first"""
+        self.fresh = iter(devices) # read lazily
+        self.retries = retries
+        self.halted = halted # returns True to stop taking fresh devices
+        self.bucket = bucket # TokenBucket for starts, or None
+        self.groups = groups or [] # GroupLimits
+        self.held = [] # (entry, retry) waiting for room in a group
+        self.maxheld = maxheld # devices read ahead past full groups
+        self.freshleft = True
+        self.polling = False # the fresh source had nothing ready
+        self.lock = Lock()
+
+
+    def startable(self, entry):
+        """Return True if every group of a device has room"""
+        for group in self.groups:
+            if group.full(entry):
+                return False
+        return True
+
+
+    def pick(self):
+        """Return the first device that may start, holding back others"""
+        for index, (entry, retry) in enumerate(self.held):
+            if self.startable(entry):
+                del self.held[index]
+                return entry
+        entry = self.retries.pop_due()
+        while entry is not None:
+            if self.startable(entry):
+                return entry
+            self.held.append((entry, True))
+            entry = self.retries.pop_due()
+        self.polling = False
+        while self.freshleft and len(self.held) < self.maxheld:
+            entry = next(self.fresh, end)
+            if entry is end:
+                self.freshleft = False
+            elif entry is None:
+                self.polling = True
+                break
+            elif self.startable(entry):
+                return entry
+            else:
+                self.held.append((entry, False))
+        return None
+
+
+    def next_device(self):
+        """Return the next device to run, or None if none is ready now"""
+        with self.lock:
+            if self.freshleft and self.halted and self.halted():
+                # Devices already started still get their retries
+                self.freshleft = False
+                self.held = [x for x in self.held if x[1]]
+            if self.bucket and self.bucket.wait_time() > 0:
+                return None
+            entry = self.pick()
+            if entry is None:
+                return None
+            for group in self.groups:
+                group.acquire(entry)
+        if self.bucket:
+            self.bucket.take()
+        return entry
+
+
+    def finished(self, entry):
+        """Free a finished device's room in its groups"""
+        with self.lock:
+            for group in self.groups:
+                group.release(entry)
+
+
+    def wait_time(self):
+        """Return seconds until a device may be ready (None if not soon)"""
+        # None means wait for a running device to finish
+        waits = []
+        if self.retries.wait_time() is not None:
+            waits.append(self.retries.wait_time())
+        if self.bucket and self.bucket.wait_time() > 0:
+            waits.append(self.bucket.wait_time())
+        if self.polling:
+            waits.append(pollwait)
+        if waits:
+            return min(waits)
+        return None
+
+
+    def exhausted(self):
+        """Return True if no fresh, held or retried devices are left"""
+        with self.lock:
+            return not self.freshleft and not self.held and \
+                    not len(self.retries)
+
+
+# A rollout in waves: a canary wave, then waves that grow by a factor
+# (1, 10, 100, ...). Results are counted as devices finish, and once the
+# failure rate passes the budget no more fresh devices are started, even
+# partway through a wave. Devices skipped as unreachable by the probe
+# never had anything sent, so they don't count.
+
+def take(devices, count):
+    """Yield up to count devices from a source, passing on any Nones"""
+    while count > 0:
+        entry = next(devices, end)
+        if entry is end:
+            return
+        if entry is not None:
+            count -= 1
+        yield entry
+
+
+class WaveBudget(netexec.results.Listener):
+
+    def __init__(self, budget=0.05, canary=1, growth=10):
+        """Initialize a wave plan with a failure budget (a fraction)"""
+        self.budget = budget
+        self.canary = canary
+        self.growth = growth
+        self.done = 0 # finished devices and failures, over all waves
+        self.failed = 0
+        self.wavedone = 0 # and in the current wave
+        self.wavefailed = 0
+        self.halted = False # set for good once over budget
+        self.lock = Lock()
+
+
+    def waves(self, devices):
+        """Yield an iterator of devices for each wave"""
+        devices = iter(devices)
+        size = self.canary
+        while True:
+            first = next(devices, end)
+            while first is None:
+                # Nothing is running between waves, so just wait
+                sleep(pollwait)
+                first = next(devices, end)
+            if first is end:
+                return
+            with self.lock:
+                self.wavedone = 0
+                self.wavefailed = 0
+            yield chain([first], take(devices, size - 1))
+            size = max(size + 1, int(size * self.growth))
+
+
+    def device_done(self, record):
+        """Take the record for a finished device"""
+        if record.get('retry') or record['status'] == 'unreachable' or \
+                record.get('commitphase') == 'confirm':
+            return
+        with self.lock:
+            self.done += 1
+            self.wavedone += 1
+            if record['status'] != 'ok':
+                self.failed += 1
+                self.wavefailed += 1
+
+
+    def exceeded(self):
+        """Return True if the failure rate is, or has been, over budget"""
+        with self.lock:
+            # Devices still running can bring the rate back under, but
+            # a halted rollout stays halted
+            if self.done > 0 and self.failed / self.done > self.budget:
+                self.halted = True
+            return self.halted
+
+
+    def report(self, number):
+        """Return a status line for a finished wave"""
+        with self.lock:
+            rate = self.failed / self.done if self.done else 0
+            return '==== Wave ' + str(number) + ': ' + \
+                    str(self.wavedone - self.wavefailed) + ' ok, ' + \
+                    str(self.wavefailed) + ' failed; ' + \
+                    '{:.1%}'.format(rate) + ' failed overall (budget ' + \
+                    '{:.1%}'.format(self.budget) + ') ===='
@@ -0,0 +1,183 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Output sinks take device output as raw bytes, as pexpect reads it from
+# the pty (sessions set them as px.logfile_read). Nothing is decoded or
+# kept around longer than it takes to write it out.
+
+from os.path import join
+from threading import Lock
+from time import time
+import sys
+
+sinktypes = ['stdout', 'prefix', 'files', 'null']
+
+
+class NullSink:
+
+    def __init__(self):
+        """Initialize a sink that throws output away"""
+        self.location = 'null'
+
+
+    def write(self, data):
+        """Write bytes of device output"""
+        pass
+
+
+    def flush(self):
+        """Flush written output"""
+        pass
+
+
+    def close(self):
+        """Finish with the sink"""
+        pass
+
+
+class StreamSink(NullSink):
+
+    def __init__(self, stream=None):
+        """Initialize a sink that writes output straight to a stream"""
+        if stream is None:
+            stream = sys.stdout.buffer
+        self.stream = stream
+        self.location = 'stdout'
+
+
+    def write(self, data):
+        """Write bytes of device output"""
+        self.stream.write(data)
+
+
+    def flush(self):
+        """Flush written output"""
+        self.stream.flush()
+
+
+class FileSink(StreamSink):
+
+    # Files written this run; retries and commit confirm phases reopen
+    # a device's file and add to it instead of replacing it
+    opened = set()
+    lock = Lock()
+
+    def __init__(self, path):
+        """Initialize a sink that writes output to its own file"""
+        with self.lock:
+            mode = 'ab' if path in self.opened else 'wb'
+            self.opened.add(path)
+        StreamSink.__init__(self, open(path, mode))
+        self.location = path
+
+
+    def close(self):
+        """Finish with the sink"""
+        self.stream.close()
+
+
+class PrefixSink(StreamSink):
+
+    # One lock for every prefixed sink sharing a stream
+    lock = Lock()
+
+    def __init__(self, prefix, stream=None, maxline=4096):
+        """Initialize a sink that writes whole lines, each with a prefix"""
+        StreamSink.__init__(self, stream)
+        self.location = 'prefix'
+        self.prefix = prefix.encode('utf-8')
+        self.maxline = maxline # longest partial line to hold back
+        self.partial = b''
+
+
+    def write(self, data):
+        """Write bytes of device output"""
+        data = self.partial + data
+        end = data.rfind(b'\n') + 1
+        if end == 0 and len(data) > self.maxline:
+            end = len(data)
+        self.partial = data[end:]
+        if end:
+            lines = data[:end].split(b'\n')
+            if not lines[-1]:
+                lines.pop()
+            with self.lock:
+                for line in lines:
+                    self.stream.write(self.prefix + line.rstrip(b'\r') + \
+                            b'\n')
+                self.stream.flush()
+
+
+    def close(self):
+        """Finish with the sink"""
+        if self.partial:
+            self.write(b'\n')
+
+
+class CountingSink:
+
+    def __init__(self, sink):
+        """Wrap a sink to count bytes and time the first byte after a mark"""
+        self.sink = sink
+        self.location = sink.location
+        self.total = 0
+        self.mark()
+
+
+    def mark(self):
+        """Start counting again, e.g. when a command is sent"""
+        self.count = 0
+        self.firstbyte = None
+
+
+    def write(self, data):
+        """Write bytes of device output"""
+        if self.firstbyte is None:
+            self.firstbyte = time()
+        self.count += len(data)
+        self.total += len(data)
+        self.sink.write(data)
+
+
+    def flush(self):
+        """Flush written output"""
+        self.sink.flush()
+
+
+    def close(self):
+        """Finish with the sink"""
+        self.sink.close()
+
+
+def new_sink(sinktype, device, outputdir='.'):
+    """Return an output sink for a device by name"""
+    if sinktype == 'stdout':
+        return StreamSink()
+    elif sinktype == 'prefix':
+        return PrefixSink(device + ': ')
+    elif sinktype == 'files':
+        filename = device.replace('/', '_') + '.log'
+        return FileSink(join(outputdir, filename))
+    elif sinktype == 'null':
+        return NullSink()
+    else:
+        raise ValueError('Unknown output type: ' + str(sinktype))
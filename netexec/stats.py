@@ -0,0 +1,91 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from math import ceil
+from threading import Lock
+import heapq
+import netexec.results
+
+phaseorder = ['spawn', 'auth', 'paging', 'check', 'config', 'compare',
+        'commit', 'exec', 'disconnect']
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0
+    rank = ceil(percent * len(values) / 100.0) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class StatsCollector(netexec.results.Listener):
+
+    def __init__(self, slowest=10):
+        """Initialize a listener that collects fleet-wide phase timings"""
+        self.phases = {}
+        self.slowest = slowest
+        self.devices = [] # heap of (seconds, device), slowest kept
+        self.lock = Lock()
+
+
+    def phase_done(self, record):
+        """Take the record for a finished phase of a session"""
+        with self.lock:
+            self.phases.setdefault(record['phase'], []).append(
+                    record['seconds'])
+
+
+    def device_done(self, record):
+        """Take the record for a finished device"""
+        seconds = record['end'] - record['start']
+        with self.lock:
+            entry = (seconds, record['device'], record['status'])
+            if len(self.devices) < self.slowest:
+                heapq.heappush(self.devices, entry)
+            else:
+                heapq.heappushpop(self.devices, entry)
+
+
+    def summary(self):
+        """Return a text summary of phase timings and slowest devices"""
+        lines = ['==== Phase timings (seconds) ====',
+                'phase'.ljust(12) + 'count'.rjust(8) + 'p50'.rjust(10) + \
+                        'p95'.rjust(10) + 'p99'.rjust(10) + 'max'.rjust(10)]
+        names = [x for x in phaseorder if x in self.phases] + \
+                sorted([x for x in self.phases if x not in phaseorder])
+        for name in names:
+            values = sorted(self.phases[name])
+            lines.append(name.ljust(12) + str(len(values)).rjust(8) + \
+                    ''.join(['{:10.3f}'.format(x) for x in
+                        [percentile(values, 50), percentile(values, 95),
+                            percentile(values, 99), values[-1]]]))
+        lines.append('')
+        lines.append('==== Slowest devices ====')
+        for seconds, device, status in sorted(self.devices, reverse=True):
+            lines.append(str(device).ljust(32) + \
+                    '{:10.3f}'.format(seconds) + '  ' + str(status))
+        return '\n'.join(lines)
+
+
+    def close(self):
+        """Print the summary"""
+        print(self.summary())
@@ -0,0 +1,161 @@
+# MIT License
+# 
+# Copyright (c) 2020 Dan Persons <dpersonsdev@gmail.com>
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Learned timeouts come from round-trip times seen in earlier runs, kept
+# per device and per command class (the first word of a line, or 'login'
+# for getting from spawn to the first prompt). Each key holds a histogram
+# of times in buckets that grow by 25%, and old counts are halved as new
+# ones come in, so the store stays small and follows recent history.
+#
+# A timeout is the p99 round trip times a margin, kept between a floor
+# and a ceiling. Keys with too few samples fall back to the whole fleet's
+# history for that command class, and then to the -t timeout. A command
+# that times out counts as a round trip as long as its timeout, so a
+# class that is slower than -t learns a longer timeout. A key that has hit
+# a timeout doesn't wait for enough samples: its longest time so far
+# stands in for the p99, so the next run waits a margin times longer.
+
+from math import log
+from threading import Lock
+from time import time
+import json
+import os
+import netexec.results
+
+bucketratio = 1.25
+bucketbase = 0.001 # seconds at the top of bucket 0
+
+
+def bucket(seconds):
+    """Return the histogram bucket for a time in seconds"""
+    if seconds <= bucketbase:
+        return 0
+    return int(log(seconds / bucketbase, bucketratio)) + 1
+
+
+def bucket_top(index):
+    """Return the largest time in seconds a bucket holds"""
+    return bucketbase * bucketratio ** index
+
+
+class TimeoutStore(netexec.results.Listener):
+
+    def __init__(self, path, margin=3.0, floor=5.0, ceiling=300.0,
+            minsamples=10, maxsamples=1000):
+        """Initialize a store of round trip times, kept in a JSON file"""
+        self.path = path
+        self.margin = margin
+        self.floor = floor
+        self.ceiling = ceiling
+        self.minsamples = minsamples # samples before a key is trusted
+        self.maxsamples = maxsamples # samples before old ones are halved
+        self.histograms = {} # 'device class': {bucket: count}
+        self.censored = set() # keys that have hit a timeout
+        self.lock = Lock()
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            for key, histogram in stored.get('histograms', {}).items():
+                self.histograms[key] = {int(x): histogram[x]
+                        for x in histogram}
+            self.censored = set(stored.get('censored', []))
+
+
+    def add(self, key, seconds):
+        """Add a round trip time to a key's histogram"""
+        histogram = self.histograms.setdefault(key, {})
+        index = bucket(seconds)
+        histogram[index] = histogram.get(index, 0) + 1
+        if sum(histogram.values()) > self.maxsamples:
+            for index in list(histogram):
+                histogram[index] //= 2
+                if not histogram[index]:
+                    del histogram[index]
+
+
+    def sample(self, device, commandclass, seconds, censored=False):
+        """Record a round trip for a device and the whole fleet"""
+        # A censored round trip was cut short by a timeout
+        with self.lock:
+            for key in (device + ' ' + commandclass, '* ' + commandclass):
+                self.add(key, seconds)
+                if censored:
+                    self.censored.add(key)
+
+
+    def p99(self, key):
+        """Return the p99 time for a key, or None without enough samples"""
+        histogram = self.histograms.get(key)
+        if not histogram:
+            return None
+        total = sum(histogram.values())
+        if total < self.minsamples:
+            if key in self.censored:
+                # Too few to trust, but the real time is at least this
+                return bucket_top(max(histogram))
+            return None
+        count = 0
+        for index in sorted(histogram):
+            count += histogram[index]
+            if count >= total * 0.99:
+                return bucket_top(index)
+
+
+    def timeout(self, device, commandclass, default):
+        """Return the timeout for a command class on a device"""
+        with self.lock:
+            p99 = self.p99(str(device) + ' ' + commandclass)
+            if p99 is None:
+                p99 = self.p99('* ' + commandclass)
+        if p99 is None:
+            return default
+        return min(self.ceiling, max(self.floor, p99 * self.margin))
+
+
+    def command_done(self, record):
+        """Take the record for a finished command"""
+        if record['status'] == 'ok' and record['matched']:
+            self.sample(record['device'], record['commandclass'],
+                    record['matched'] - record['sent'])
+        elif record['status'] == 'timeout':
+            # Records are handed over as soon as the timeout hits
+            self.sample(record['device'], record['commandclass'],
+                    time() - record['sent'], censored=True)
+
+
+    def phase_done(self, record):
+        """Take the record for a finished phase of a session"""
+        if record['phase'] == 'auth' and \
+                record['status'] in ('ok', 'timeout'):
+            self.sample(record['device'], 'login', record['seconds'],
+                    censored=record['status'] == 'timeout')
+
+
+    def close(self):
+        """Save the store, replacing the file in one step"""
+        with self.lock:
+            stored = {'histograms': self.histograms,
+                    'censored': sorted(self.censored)}
+            temp = self.path + '.tmp'
+            with open(temp, 'w') as f:
+                json.dump(stored, f)
+            os.replace(temp, self.path)
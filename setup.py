@@ -31,27 +31,128 @@ Options
 ::
 
     usage: netexec [-h] [--version] [-y] [-u USER] [-p] [-c COMMAND]
-               [-x | --commit] [-d DEVICETYPE] [--list-types] [-i INPUT]
-               [-t TIMEOUT] [-l DEVICELIST]
-               [device]
+                   [-x | --commit] [--commit-confirmed MINUTES]
+                   [--confirm-workers CONFIRMWORKERS] [-d DEVICETYPE]
+                   [--list-types] [-i INPUT] [-t TIMEOUT] [-l DEVICELIST]
+                   [--shard SHARD] [-w WORKERS] [--rate-limit RATELIMIT]
+                   [--rate-burst RATEBURST] [--group-limit ATTR=N] [--waves]
+                   [--canary CANARY] [--wave-growth WAVEGROWTH]
+                   [--failure-budget FAILUREBUDGET] [--retry CLASS=N]
+                   [--retry-backoff RETRYBACKOFF] [--probe]
+                   [--probe-port PROBEPORT] [--probe-timeout PROBETIMEOUT]
+                   [--timeout-store TIMEOUTSTORE] [--timeout-margin TIMEOUTMARGIN]
+                   [--timeout-floor TIMEOUTFLOOR]
+                   [--timeout-ceiling TIMEOUTCEILING]
+                   [--pacing {none,fixed,adaptive}] [--delay DELAY]
+                   [--window WINDOW] [--bulk {set,merge}]
+                   [-o {stdout,prefix,files,null}] [--output-dir OUTPUTDIR]
+                   [--results RESULTS] [--stats] [--journal JOURNAL] [--resume]
+                   [--record RECORD] [--replay REPLAY]
+                   [--replay-speed REPLAYSPEED] [--async]
+                   [device]
     
     positional arguments:
-      device           specify a device to which to connect
+      device                specify a device to which to connect
     
     optional arguments:
-      -h, --help       show this help message and exit
-      --version        show program's version number and exit
-      -y               send "yes" for host key check (not recommended)
-      -u USER          set a username
-      -p               use a password (will prompt; DO NOT enter as arg)
-      -c COMMAND       command to connect (default ssh)
-      -x, --exec-mode  enter lines in exec mode, instead of config mode
-      --commit         commit config and exit (no interactive mode
-      -d DEVICETYPE    set the device type (junos, ios, etc)
-      --list-types     list available device types
-      -i INPUT         set the input file for commands
-      -t TIMEOUT       set the timeout for spawning and sending lines
-      -l DEVICELIST    connect to all devices in specified list file
+      -h, --help            show this help message and exit
+      --version             show program's version number and exit
+      -y                    send "yes" for host key check (not recommended)
+      -u USER               set a username
+      -p                    use a password (will prompt; DO NOT enter as arg)
+      -c COMMAND            command to connect (default ssh; run directly, not
+                            through a shell)
+      -x, --exec-mode       enter lines in exec mode, instead of config mode
+      --commit              commit config and exit (no interactive mode
+      --commit-confirmed MINUTES
+                            commit with commit confirmed on all devices, then
+                            confirm on all that still answer
+      --confirm-workers CONFIRMWORKERS
+                            set the number of devices to confirm at once (default
+                            -w)
+      -d DEVICETYPE         set the device type (junos, ios, etc)
+      --list-types          list available device types
+      -i INPUT              set the input file for commands
+      -t TIMEOUT            set the timeout for spawning and sending lines
+      -l DEVICELIST         connect to all devices in specified list file (or
+                            .csv/.yaml inventory)
+      --shard SHARD         only run devices in slice i of N (i/N, from 1/N);
+                            split by a stable hash of the device name
+      -w WORKERS, --workers WORKERS
+                            set the number of devices to run at once (more than 1
+                            disables interactive mode)
+      --rate-limit RATELIMIT
+                            start at most this many sessions per second
+      --rate-burst RATEBURST
+                            let this many sessions start at once before --rate-
+                            limit applies (default 1)
+      --group-limit ATTR=N  run at most N devices at once per value of an
+                            inventory column (e.g. site=4, devicetype=10)
+      --waves               roll out in waves that grow from a canary, and stop if
+                            too many devices fail
+      --canary CANARY       set the size of the first wave (default 1)
+      --wave-growth WAVEGROWTH
+                            multiply each wave size by this (default 10)
+      --failure-budget FAILUREBUDGET
+                            stop starting devices once more than this share of
+                            them fail (default 0.05)
+      --retry CLASS=N       set retries for a failure class: auth, connect,
+                            config, exec, device (default auth=0, connect=2,
+                            config=0, exec=1, device=0)
+      --retry-backoff RETRYBACKOFF
+                            set the base retry delay in seconds; it doubles with
+                            each attempt, with jitter (default 2)
+      --probe               check each device port with a quick TCP connection
+                            first, skipping (or retrying) devices that are down
+      --probe-port PROBEPORT
+                            set the port to probe, if the inventory doesn't set
+                            one (default 22; a port given in -c, like 'ssh -p
+                            2222', is not seen)
+      --probe-timeout PROBETIMEOUT
+                            set the probe connect timeout in seconds (default 3)
+      --timeout-store TIMEOUTSTORE
+                            learn round trip times per device and command in this
+                            file, and set timeouts from them (-t until there is
+                            enough history)
+      --timeout-margin TIMEOUTMARGIN
+                            multiply p99 round trip times by this for learned
+                            timeouts (default 3)
+      --timeout-floor TIMEOUTFLOOR
+                            set the shortest learned timeout in seconds (default
+                            5)
+      --timeout-ceiling TIMEOUTCEILING
+                            set the longest learned timeout in seconds (default
+                            300)
+      --pacing {none,fixed,adaptive}
+                            set the delay policy between lines (default set by
+                            device type)
+      --delay DELAY         set the fixed (or most adaptive) delay in seconds
+      --window WINDOW       send up to this many config lines before waiting for
+                            their prompts (pipelined mode)
+      --bulk {set,merge}    load the input file in one bulk config load (load
+                            set/merge terminal on junos)
+      -o {stdout,prefix,files,null}, --output {stdout,prefix,files,null}
+                            set where device output goes (default stdout, or
+                            prefix with more than 1 worker)
+      --output-dir OUTPUTDIR
+                            set the directory for -o files (default .)
+      --results RESULTS     append a JSON record per command and per device to
+                            this file (JSONL)
+      --stats               print phase timing percentiles and the slowest devices
+                            at the end
+      --journal JOURNAL     append each finished device to this file (synced to
+                            disk as it goes)
+      --resume              skip devices the --journal file has as done with the
+                            same input and mode
+      --record RECORD       capture each session (timed bytes sent and received)
+                            to a file in this directory
+      --replay REPLAY       play sessions back from captures in this directory
+                            instead of connecting
+      --replay-speed REPLAYSPEED
+                            set the replay speed factor (default 1.0; 0 for as
+                            fast as possible)
+      --async               run sessions from one asyncio event loop (no
+                            interactive mode; -w sets the session limit)
     
     ==== Available parsing modules: ====
     